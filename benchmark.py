@@ -0,0 +1,378 @@
+'''
+ Benchmarks of the label model on synthetic batches shaped like a config.
+
+ python benchmark.py -config movie.yaml -bench optim
+ python benchmark.py -config movie.yaml -bench serving -url http://127.0.0.1:8000 -src_file test.src
+'''
+
+import torch
+from torch.autograd import Variable
+
+import argparse
+import importlib.util
+import json
+import os
+import pickle
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import opts
+import models
+import utils
+from inference import load_predictor, DecodingPool
+
+parser = argparse.ArgumentParser(description='benchmark.py')
+opts.model_opts(parser)
+parser.set_defaults(model='label')
+parser.add_argument('-bench', required=True, type=str,
+                    help="benchmark to run: optim, checkpoint, bf16, script, serving, scheduler, load, startup")
+parser.add_argument('-steps', type=int, default=20, help="timed steps per setting")
+parser.add_argument('-warmup', type=int, default=3, help="untimed steps per setting")
+parser.add_argument('-vocab_size', type=int, default=50000, help="vocabulary size of the synthetic data")
+parser.add_argument('-src_len', type=int, default=200, help="longest source length of the synthetic data")
+parser.add_argument('-tgt_len', type=int, default=0, help="target length, max_time_step by default")
+parser.add_argument('-optims', default=['adam', 'adafactor'], nargs='+', type=str,
+                    help="optimizers to compare")
+parser.add_argument('-url', default='http://127.0.0.1:8000', type=str, help="address of a running server.py")
+parser.add_argument('-src_file', default='', type=str, help="reviews sent to the server, one per line")
+parser.add_argument('-concurrency', type=int, default=16, help="clients sending requests at the same time")
+parser.add_argument('-max_batch_size', type=int, default=32, help="decoding pool and batch size of -bench scheduler")
+parser.add_argument('-segments', default=[0, 1, 5, 10], nargs='+', type=int,
+                    help="decoder checkpoint segment sizes to compare, 0 disables checkpointing")
+
+opt = parser.parse_args()
+config = utils.read_config(opt.config)
+torch.manual_seed(opt.seed)
+opts.convert_to_config(opt, config)
+
+use_cuda = torch.cuda.is_available() and len(opt.gpus) > 0
+config.use_cuda = use_cuda
+if use_cuda:
+    torch.cuda.set_device(opt.gpus[0])
+config.src_vocab_size = config.tgt_vocab_size = opt.vocab_size
+
+
+def random_batch():
+    batch_size, src_len = config.batch_size, opt.src_len
+    tgt_len = opt.tgt_len or config.max_time_step
+    lengths = torch.randint(src_len // 2, src_len + 1, (batch_size,)).sort(descending=True)[0]
+    lengths[0] = src_len
+    src = torch.randint(4, opt.vocab_size, (batch_size, src_len))
+    src.masked_fill_(torch.arange(src_len).unsqueeze(0) >= lengths.unsqueeze(1), utils.PAD)
+    tgt = torch.randint(4, opt.vocab_size, (batch_size, tgt_len + 1))
+    tgt[:, 0] = utils.BOS
+    label = torch.randint(0, config.num_label, (batch_size,))
+    batch = [Variable(x) for x in (src, tgt, label, lengths)]
+    if use_cuda:
+        batch = [x.cuda() for x in batch]
+    return batch
+
+
+def build_model():
+    model = getattr(models, opt.model)(config)
+    if use_cuda:
+        model.cuda()
+    return model
+
+
+def build_optim(model, method):
+    optim = models.Optim(method, config.learning_rate, config.max_grad_norm)
+    optim.set_parameters(model.parameters(), sparse_params=models.sparse_parameters(model))
+    return optim
+
+
+def train_step(model, optim, batch):
+    src, tgt, label, lengths = batch
+    model.zero_grad()
+    with utils.autocast(config):
+        loss, _ = model(src, lengths, tgt[:, :-1], tgt[:, 1:], label)
+    loss.backward()
+    optim.step()
+    return float(loss)
+
+
+def tensor_bytes(tensors):
+    return sum(t.numel() * t.element_size() for t in tensors if torch.is_tensor(t))
+
+
+def optim_state_bytes(optim):
+    optimizers = [optim.optimizer] + ([optim.sparse_optimizer] if optim.sparse_optimizer else [])
+    return sum(tensor_bytes(state.values()) for o in optimizers for state in o.state.values())
+
+
+def saved_tensor_bytes(model, batch):
+    """Bytes of distinct storages the autograd graph of one forward pass keeps alive."""
+    storages = {}
+
+    def pack(t):
+        storage = t.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return t
+
+    src, tgt, label, lengths = batch
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        loss, _ = model(src, lengths, tgt[:, :-1], tgt[:, 1:], label)
+    params = set(p.untyped_storage().data_ptr() for p in model.parameters())
+    return sum(n for ptr, n in storages.items() if ptr not in params)
+
+
+def timed_steps(model, optim, batch):
+    for _ in range(opt.warmup):
+        train_step(model, optim, batch)
+    start = time.time()
+    for _ in range(opt.steps):
+        loss = train_step(model, optim, batch)
+    return (time.time() - start) / opt.steps, loss
+
+
+def bench_optim():
+    """Optimizer state size and training speed of every method in -optims."""
+    batch = random_batch()
+    rows = []
+    for method in opt.optims:
+        torch.manual_seed(opt.seed)
+        model = build_model()
+        optim = build_optim(model, method)
+        step_time, loss = timed_steps(model, optim, batch)
+        rows.append((method, tensor_bytes(model.parameters()) / 2**20,
+                     optim_state_bytes(optim) / 2**20, 1 / step_time, loss))
+        del model, optim
+
+    print('%-10s %12s %12s %10s %10s' % ('optim', 'params MB', 'state MB', 'steps/s', 'loss'))
+    for row in rows:
+        print('%-10s %12.1f %12.1f %10.2f %10.4f' % row)
+
+
+def bench_checkpoint():
+    """Activation memory and training speed for every segment size in -segments."""
+    batch = random_batch()
+    rows = []
+    for segment in opt.segments:
+        config.checkpoint_segment = segment
+        torch.manual_seed(opt.seed)
+        model = build_model()
+        optim = build_optim(model, config.optim)
+        saved = saved_tensor_bytes(model, batch) / 2**20
+        if use_cuda:
+            torch.cuda.reset_peak_memory_stats()
+        step_time, loss = timed_steps(model, optim, batch)
+        peak = '%.1f' % (torch.cuda.max_memory_allocated() / 2**20) if use_cuda else '-'
+        rows.append((segment, int(config.checkpoint_encoder), saved, peak, 1 / step_time, loss))
+        del model, optim
+
+    print('%8s %8s %16s %12s %10s %10s' % ('segment', 'encoder', 'saved MB (proxy)', 'peak MB', 'steps/s', 'loss'))
+    for row in rows:
+        print('%8d %8d %16.1f %12s %10.2f %10.4f' % row)
+    print('saved MB: tensors the autograd graph of one forward keeps for backward, '
+          'a proxy for activation memory; peak MB is only measured on CUDA')
+
+
+def timed_decoding(model, batch):
+    src, tgt, label, lengths = batch
+    order = torch.arange(src.size(0), device=src.device)
+    model.eval()
+    with torch.no_grad(), utils.autocast(config):
+        for _ in range(opt.warmup):
+            model.sample(src, lengths, label, reverse_indices=order)
+        start = time.time()
+        for _ in range(opt.steps):
+            samples = model.sample(src, lengths, label, reverse_indices=order)[0]
+    model.train()
+    return (time.time() - start) / opt.steps, samples
+
+
+def bench_bf16():
+    """Training and greedy decoding speed in float32 and under bf16 autocast."""
+    batch = random_batch()
+    rows, samples = [], {}
+    for bf16 in (False, True):
+        config.bf16 = bf16
+        torch.manual_seed(opt.seed)
+        model = build_model()
+        decode_time, samples[bf16] = timed_decoding(model, batch)
+        optim = build_optim(model, config.optim)
+        step_time, loss = timed_steps(model, optim, batch)
+        rows.append(('bf16' if bf16 else 'float32', 1 / step_time, loss,
+                     config.batch_size / decode_time))
+        del model, optim
+
+    print('%-10s %10s %10s %12s' % ('precision', 'steps/s', 'loss', 'decoded/s'))
+    for row in rows:
+        print('%-10s %10.2f %10.4f %12.1f' % row)
+    agreement = samples[True].eq(samples[False]).float().mean()
+    print('greedy tokens agreeing with float32 on synthetic data: %.2f%%' % (100 * float(agreement)))
+
+    if not opt.restore:
+        print('ROUGE and rating accuracy are not measured, '
+              'pass -restore with a trained checkpoint to decode the test set of the config')
+        return
+    predictor = load_predictor(config, opt.restore)
+    scores = {}
+    for bf16 in (False, True):
+        config.bf16 = bf16
+        scores[bf16] = test_scores(predictor)
+    print('\n%-10s %8s %8s %8s %8s' % ('precision', 'R-1', 'R-2', 'R-L', 'acc-5'))
+    print('%-10s %8.2f %8.2f %8.2f %8.2f' % (('float32',) + tuple(scores[False])))
+    print('%-10s %8.2f %8.2f %8.2f %8.2f' % (('bf16',) + tuple(scores[True])))
+    print('%-10s %+8.2f %+8.2f %+8.2f %+8.2f' % (('delta',) + tuple(b - f for b, f in zip(scores[True],
+                                                                                          scores[False]))))
+
+
+def test_scores(predictor):
+    """ROUGE F1 and rating accuracy of `predictor` on the test set of the config."""
+    test = pickle.load(open(config.data+'data.pkl', 'rb'))['test']
+    sources = open(test['original_srcF'], encoding='utf8').readlines()
+    references = [line.split() for line in open(test['original_tgtF'], encoding='utf8')]
+    labels = [int(line) for line in open(test['labF'])]
+
+    results = predictor.predict(sources, getattr(config, 'valid_batch_size', config.batch_size))
+    f_score, _, _ = utils.rouge_scores(references, [r['summary'].split() for r in results],
+                                       tempfile.mkdtemp() + '/')
+    correct = sum(result['label'] == label for result, label in zip(results, labels))
+    return f_score + [correct * 100.0 / len(labels)]
+
+
+def bench_script():
+    """Greedy decoding speed of eager `sample` and of the TorchScript bundle."""
+    src, tgt, label, lengths = batch = random_batch()
+    torch.manual_seed(opt.seed)
+    model = build_model()
+    eager_time, eager_samples = timed_decoding(model, batch)
+
+    scripted = models.script_label(model)
+    with torch.no_grad():
+        for _ in range(opt.warmup):
+            scripted(src, lengths, config.max_time_step)
+        start = time.time()
+        for _ in range(opt.steps):
+            samples = scripted(src, lengths, config.max_time_step)[0]
+    script_time = (time.time() - start) / opt.steps
+
+    print('%-10s %12s' % ('decoder', 'decoded/s'))
+    print('%-10s %12.1f' % ('eager', config.batch_size / eager_time))
+    print('%-10s %12.1f' % ('script', config.batch_size / script_time))
+    agreement = samples.eq(eager_samples).float().mean()
+    print('greedy tokens agreeing with eager: %.2f%%' % (100 * float(agreement)))
+
+
+def bench_serving():
+    """
+    Throughput and latency of server.py under -concurrency clients sending one
+    review per request, and, given -restore, the offline batch throughput.
+    """
+    texts = [line.strip() for line in open(opt.src_file, encoding='utf8')]
+    latencies, next_text, lock = [], iter(range(len(texts))), threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                i = next(next_text, None)
+            if i is None:
+                return
+            data = json.dumps({'text': texts[i]}).encode('utf8')
+            start = time.time()
+            urllib.request.urlopen(urllib.request.Request(opt.url + '/predict', data=data)).read()
+            with lock:
+                latencies.append(time.time() - start)
+
+    start = time.time()
+    clients = [threading.Thread(target=client) for _ in range(opt.concurrency)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    print('server: %.1f reviews/s, latency p50 %.1fms p99 %.1fms' %
+          (len(texts) / elapsed, 1000 * latencies[len(latencies) // 2],
+           1000 * latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]))
+    print('server stats: %s' % urllib.request.urlopen(opt.url + '/stats').read().decode('utf8'))
+
+    if opt.restore:
+        predictor = load_predictor(config, opt.restore)
+        start = time.time()
+        predictor.predict(texts, getattr(config, 'valid_batch_size', config.batch_size))
+        print('offline: %.1f reviews/s' % (len(texts) / (time.time() - start)))
+
+
+def bench_scheduler():
+    """
+    Agreement of the continuous decoding pool with batch decoding on the
+    reviews of -src_file, for batches of one review and of -max_batch_size.
+    The pool masks every review to its own length, batches of several
+    reviews attend over and pool the padding of the longer ones.
+    """
+    predictor = load_predictor(config, opt.restore)
+    sources = [predictor.tokenize(line) for line in open(opt.src_file, encoding='utf8')]
+
+    # the pool is kept full, reviews join as others leave
+    pooled, pending = [None] * len(sources), list(range(len(sources)))
+    pool = DecodingPool(predictor)
+    start = time.time()
+    while len(pending) > 0 or len(pool) > 0:
+        if len(pending) > 0 and len(pool) < opt.max_batch_size:
+            joining = pending[:opt.max_batch_size - len(pool)]
+            pending = pending[len(joining):]
+            pool.add([sources[i] for i in joining], joining)
+        for i, result in pool.step():
+            pooled[i] = result
+    rows = [('pool', len(sources) / (time.time() - start), 100.0, 100.0, 0.0)]
+
+    for batch_size in (1, opt.max_batch_size):
+        start = time.time()
+        batched = predictor.decode_sorted(sources, batch_size)
+        elapsed = time.time() - start
+        summaries = sum(b['summary'] == p['summary'] for b, p in zip(batched, pooled))
+        labels = sum(b['label'] == p['label'] for b, p in zip(batched, pooled))
+        probs = max(abs(x - y) for b, p in zip(batched, pooled) for x, y in zip(b['probs'], p['probs']))
+        rows.append(('batch %d' % batch_size, len(sources) / elapsed, summaries * 100.0 / len(sources),
+                     labels * 100.0 / len(sources), probs))
+
+    print('%-10s %12s %12s %12s %12s' % ('decoding', 'reviews/s', 'summary %', 'label %', 'max |dp|'))
+    for row in rows:
+        print('%-10s %12.1f %12.2f %12.2f %12.4f' % row)
+
+
+def bench_load():
+    """Time and peak memory of loading the -restore checkpoint or export for inference."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    predictor = load_predictor(config, opt.restore)
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print('loaded %s in %.2fs, peak memory +%.1f MB, weights %.1f MB' %
+          (opt.restore, elapsed, peak / 1024, tensor_bytes(predictor.model.state_dict().values()) / 2**20))
+
+
+def bench_startup():
+    """Wall time of fresh interpreters importing the repo's modules, best of -steps runs."""
+    statements = ['import torch', 'import utils', 'import models', 'import models; models.label',
+                  'import utils; utils.CheckpointSaver', 'import inference']
+    if importlib.util.find_spec('pyrouge') is not None:
+        # the metrics import pyrouge
+        statements.insert(-1, 'import utils; utils.rouge')
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    print('%-32s %10s' % ('statement', 'seconds'))
+    for statement in statements:
+        times = []
+        for _ in range(opt.steps):
+            start = time.time()
+            subprocess.check_call([sys.executable, '-c', statement], cwd=cwd,
+                                  stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+            times.append(time.time() - start)
+        print('%-32s %10.3f' % (statement, min(times)))
+
+
+benchmarks = {'optim': bench_optim, 'checkpoint': bench_checkpoint, 'bf16': bench_bf16,
+              'script': bench_script, 'serving': bench_serving, 'scheduler': bench_scheduler, 'load': bench_load,
+              'startup': bench_startup}
+
+
+if __name__ == '__main__':
+    benchmarks[opt.bench]()
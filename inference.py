@@ -0,0 +1,420 @@
+'''
+ Summarization and sentiment classification of raw reviews with a trained
+ label model, shared by predict.py and the serving code.
+'''
+
+import torch
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+
+import models
+import utils
+
+
+def load_vocab(config):
+    datas = pickle.load(open(config.data+'data.pkl', 'rb'))
+    return datas['dict']['src'], datas['dict']['tgt']
+
+
+# settings that determine the shape of a model, taken from slim exports
+architecture = ['model', 'cell', 'attention', 'emb_size', 'hidden_size', 'enc_num_layers', 'dec_num_layers',
+                'bidirectional', 'shared_vocab', 'pool_size', 'num_label', 'src_vocab_size', 'tgt_vocab_size']
+
+
+def load_checkpoint(path, trusted=False):
+    """
+    Checkpoints of tensors and plain values, like slim exports, are
+    memory-mapped. Anything else is only unpickled when `trusted`, since
+    unpickling runs the code stored in the file.
+    """
+    try:
+        return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    except pickle.UnpicklingError as e:
+        if not trusted:
+            raise pickle.UnpicklingError("%s holds more than tensors and plain values, pass -trust_checkpoint "
+                                         "to unpickle it if it comes from a trusted source" % path) from e
+        return torch.load(path, map_location='cpu', weights_only=False)
+
+
+def decode_vocab(data):
+    """A Dict from the newline separated words written by label_export.py -format slim."""
+    vocab = utils.Dict()
+    vocab.loadDict(bytes(data.numpy()).decode('utf8').split('\n'))
+    return vocab
+
+
+def load_model(config, checkpoints):
+    if checkpoints.get('format') == 'int8':
+        return models.load_quantized(config, checkpoints['model']).eval()
+    if checkpoints.get('format') == 'slim':
+        # no memory is allocated for the initial weights, the module takes the mapped tensors
+        with torch.device('meta'):
+            model = getattr(models, config.model)(config)
+        state_dict = checkpoints['model']
+        if checkpoints['dtype'] in ('float16', 'bfloat16'):
+            # the model computes in float32, -bf16 autocasts back where it is safe
+            state_dict = {k: v.float() if v.is_floating_point() else v for k, v in state_dict.items()}
+        model.load_state_dict(state_dict, assign=True)
+    else:
+        model = getattr(models, config.model)(config)
+        model.load_state_dict(checkpoints['model'])
+    if config.use_cuda:
+        model.cuda()
+    model.eval()
+    return model
+
+
+def load_predictor(config, path, src_trun=0, cache=None, continuous=False):
+    print('loading checkpoint...', file=sys.stderr)
+    checkpoints = load_checkpoint(path, trusted=config.trust_checkpoint)
+    if checkpoints.get('format') == 'slim':
+        for key in architecture:
+            if key in checkpoints['config']:
+                config[key] = checkpoints['config'][key]
+        src_vocab, tgt_vocab = decode_vocab(checkpoints['src_vocab']), decode_vocab(checkpoints['tgt_vocab'])
+    else:
+        print('loading vocabulary...', file=sys.stderr)
+        src_vocab, tgt_vocab = load_vocab(config)
+    config.src_vocab_size = src_vocab.size()
+    config.tgt_vocab_size = tgt_vocab.size()
+
+    model = load_model(config, checkpoints)
+    if config.temperature <= 0:
+        config.temperature = float(checkpoints.get('temperature', 1.0))
+    stat = os.stat(path)
+    model_id = '%s:%d:%d' % (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    return Predictor(model, src_vocab, tgt_vocab, config, src_trun=src_trun, cache=cache, model_id=model_id,
+                     continuous=continuous)
+
+
+def build_cache(config):
+    """The result cache configured by -cache_mb and -cache_db, if any."""
+    if config.cache_mb <= 0 and not config.cache_db:
+        return None
+    return utils.ResultCache(max_bytes=int(config.cache_mb * 2**20), path=config.cache_db or None)
+
+
+class Predictor(object):
+    """
+    Reviews are tokenized like label_preprocess.py, decoded in batches sorted
+    by length and returned in input order, each as a dict with the summary,
+    the 1-based rating and the probability of every rating. Sentiment-only
+    predictions leave out the summary and skip decoding it where the model
+    allows.
+
+    With a `cache`, results are stored under a hash of the source ids and of
+    everything else that determines them, so repeated reviews are neither
+    encoded nor decoded again. `continuous` marks a predictor whose
+    summaries come from a DecodingPool, which may differ from those of
+    batches, so they are cached apart.
+
+    Threads take `lock` around every use of the model, whose attention
+    modules hold the context of the batch being decoded.
+    """
+
+    def __init__(self, model, src_vocab, tgt_vocab, config, src_trun=0, cache=None, model_id='', continuous=False):
+        self.model = model
+        self.src_vocab = src_vocab
+        self.tgt_vocab = tgt_vocab
+        self.config = config
+        self.src_trun = src_trun
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.fingerprint = json.dumps([model_id, config.model, config.beam_size, config.max_time_step,
+                                       config.length_norm, config.unk, config.bf16, src_trun,
+                                       config.temperature, config.until_eos,
+                                       'continuous' if continuous else 'batch'])
+
+    def tokenize(self, text):
+        words = text.strip().lower().split()
+        return words[:self.src_trun] if self.src_trun > 0 else words
+
+    def cache_key(self, words, sentiment=False):
+        ids = self.src_vocab.convertToIdx(words, utils.UNK_WORD)
+        if sentiment:
+            return hashlib.sha1(json.dumps([self.fingerprint, 'sentiment', ids]).encode('utf8')).hexdigest()
+        if self.config.unk:
+            # unknown words are copied into the summary, so they are part of the key
+            ids = [i if i != utils.UNK else w for i, w in zip(ids, words)]
+        return hashlib.sha1(json.dumps([self.fingerprint, ids]).encode('utf8')).hexdigest()
+
+    def lookup(self, sources, sentiment=False):
+        """Cache keys and cached results (None on a miss) of tokenized reviews."""
+        keys = [self.cache_key(words, sentiment) for words in sources]
+        return keys, [self.cache.get(key) for key in keys]
+
+    def source_batch(self, sources):
+        """
+        The length-sorted order of tokenized reviews, their time-major padded
+        ids and their lengths.
+        """
+        ids = [self.src_vocab.convertToIdx(words, utils.UNK_WORD) or [utils.UNK] for words in sources]
+        order = sorted(range(len(ids)), key=lambda i: -len(ids[i]))
+        lengths = torch.LongTensor([len(ids[i]) for i in order])
+        src = torch.LongTensor(int(lengths[0]), len(ids)).fill_(utils.PAD)
+        for j, i in enumerate(order):
+            src[:len(ids[i]), j] = torch.LongTensor(ids[i])
+        if self.config.use_cuda:
+            src, lengths = src.cuda(), lengths.cuda()
+        return order, src, lengths
+
+    def decode(self, sources):
+        """Decode one batch of tokenized reviews."""
+        config = self.config
+        order, src, lengths = self.source_batch(sources)
+
+        model = self.model
+        with self.lock, torch.no_grad(), utils.autocast(config):
+            contexts, state = model.encoder(src, lengths.tolist())
+            if config.beam_size > 1:
+                samples, alignments, label_scores = model.beam_decode(contexts, state, config.beam_size,
+                                                                      config.max_time_step, config.length_norm)
+                alignments = [a.tolist() for a in alignments]
+            else:
+                outputs, attn_matrix, pooled = model.greedy_decode(contexts, state, config.max_time_step,
+                                                                   config.until_eos)
+                label_scores = model.classify(pooled.unsqueeze(0))
+                samples, alignments = outputs.t().tolist(), attn_matrix.max(2)[1].t().tolist()
+            probs = torch.nn.functional.softmax(label_scores.float() / config.temperature, dim=1).tolist()
+
+        results = [None] * len(sources)
+        for j, i in enumerate(order):
+            results[i] = self.result(sources[i], samples[j], alignments[j], probs[j])
+        return results
+
+    def decode_sentiment(self, sources):
+        """Ratings of one batch of tokenized reviews, without their summaries."""
+        config = self.config
+        order, src, lengths = self.source_batch(sources)
+        # the batch is already sorted, the identity keeps that order
+        identity = torch.arange(len(sources), device=src.device)
+        with self.lock, torch.no_grad(), utils.autocast(config):
+            probs = self.model.predict_sentiment(src.t(), lengths, reverse_indices=identity,
+                                                 until_eos=config.until_eos,
+                                                 temperature=config.temperature).tolist()
+
+        results = [None] * len(sources)
+        for j, i in enumerate(order):
+            results[i] = self.rating(probs[j])
+        return results
+
+    def stream_tokens(self, texts):
+        """
+        Greedy decoding of one batch of reviews that yields (index, event)
+        pairs as it goes: {'token': word} for every decoded word, then the
+        prediction of every review, the same as `decode` gives. Models
+        without a classifier, like seq2seq, end with the summary only. Beam
+        search cannot be streamed. The lock is held for one step at a time.
+        """
+        config = self.config
+        if config.beam_size > 1:
+            raise ValueError("only greedy decoding can be streamed, not -beam_size %d" % config.beam_size)
+        sources = [self.tokenize(text) for text in texts]
+        order, src, lengths = self.source_batch(sources)
+        # the model gets the sorted batch and answers in the order of `sources`
+        reverse_indices = torch.LongTensor(len(order))
+        reverse_indices[torch.LongTensor(order)] = torch.arange(len(order))
+        steps = self.model.stream_sample(src.t(), lengths, sources, self.tgt_vocab,
+                                         reverse_indices.to(src.device))
+
+        summaries = [[] for _ in sources]
+        while True:
+            with self.lock, torch.no_grad(), utils.autocast(config):
+                # a model without a classifier just stops, without ('label', scores)
+                kind, values = next(steps, ('label', None))
+            if kind == 'label':
+                break
+            for i, word in enumerate(values):
+                if word is not None:
+                    summaries[i].append(word.strip())
+                    yield i, {'token': word.strip()}
+
+        probs = None
+        if values is not None:
+            probs = torch.nn.functional.softmax(values.float() / config.temperature, dim=1).tolist()
+        for i in range(len(sources)):
+            result = {'summary': ' '.join(summaries[i])}
+            if probs is not None:
+                result.update(self.rating(probs[i]))
+            yield i, result
+
+    def result(self, source, sample, alignment, probs):
+        words = self.tgt_vocab.convertToLabels(sample, utils.EOS)
+        if words == [utils.UNK]:
+            # convertToLabels marks an empty summary by the unk id
+            words = []
+        if self.config.unk:
+            words = utils.replace_unk([source], [words], [alignment])[0]
+        return dict(summary=' '.join(word.strip() for word in words), **self.rating(probs))
+
+    def rating(self, probs):
+        return {'label': max(range(len(probs)), key=lambda k: probs[k]) + 1,
+                'probs': [round(p, 4) for p in probs]}
+
+    def predict(self, texts, batch_size, sentiment=False):
+        """Predictions for a list of reviews, decoded in length-sorted batches."""
+        sources = [self.tokenize(text) for text in texts]
+        if self.cache is None:
+            return self.decode_sorted(sources, batch_size, sentiment)
+
+        keys, results = self.lookup(sources, sentiment)
+        # reviews repeated within the list are decoded once
+        misses = {}
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                misses.setdefault(key, i)
+        decoded = self.decode_sorted([sources[i] for i in misses.values()], batch_size, sentiment)
+        for key, result in zip(misses, decoded):
+            self.cache.put(key, result)
+            misses[key] = result
+        return [result if result is not None else misses[key] for key, result in zip(keys, results)]
+
+    def predict_sentiment(self, texts, batch_size):
+        """Ratings and their probabilities for a list of reviews."""
+        return self.predict(texts, batch_size, sentiment=True)
+
+    def decode_sorted(self, sources, batch_size, sentiment=False):
+        decode = self.decode_sentiment if sentiment else self.decode
+        order = sorted(range(len(sources)), key=lambda i: -len(sources[i]))
+        results = [None] * len(sources)
+        for k in range(0, len(order), batch_size):
+            batch = order[k:k+batch_size]
+            for i, result in zip(batch, decode([sources[i] for i in batch])):
+                results[i] = result
+        return results
+
+    def stream(self, texts, batch_size, chunk_size, sentiment=False):
+        """
+        Predictions for an iterable of reviews, read `chunk_size` at a time so
+        that memory does not grow with the input.
+        """
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) == chunk_size:
+                for result in self.predict(chunk, batch_size, sentiment):
+                    yield result
+                chunk = []
+        for result in self.predict(chunk, batch_size, sentiment):
+            yield result
+
+
+class DecodingPool(object):
+    """
+    Iteration-level greedy decoding: reviews join the pool and leave it
+    between decoder steps instead of waiting for a whole batch to finish.
+    Every row keeps its own encoder context, its decoder state and a running
+    max-pool of its sentiment states. A row leaves at </s> with -until_eos,
+    otherwise after max_time_step steps, like `label.sample`.
+
+    Unlike a batch, the attention and the max-pool of a row are masked to
+    its own length. A review decoded with longer ones in a batch attends
+    over, and pools, their padding as well, so its summary and rating may
+    differ from the pool's; alone in a batch it gets the same. See
+    benchmark.py -bench scheduler.
+    """
+
+    def __init__(self, predictor):
+        if predictor.config.beam_size > 1:
+            raise ValueError("the decoding pool is greedy, it cannot decode with -beam_size %d"
+                             % predictor.config.beam_size)
+        self.predictor = predictor
+        self.model = predictor.model
+        self.config = predictor.config
+        self.rows = []
+        self.context = self.mask = self.state = self.input = self.pooled = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, sources, tags):
+        """Encode tokenized `sources` and let them join; `tags` are returned with their results."""
+        order, src, lengths = self.predictor.source_batch(sources)
+        with self.predictor.lock, torch.no_grad(), utils.autocast(self.config):
+            contexts, state = self.model.encoder(src, lengths.tolist())
+        mask = torch.arange(contexts.size(0), device=contexts.device).unsqueeze(0) >= lengths.unsqueeze(1)
+        pooled = contexts.float().masked_fill(mask.t().unsqueeze(2), -float('inf')).max(0)[0]
+        input = torch.LongTensor(len(sources)).fill_(utils.BOS).to(contexts.device)
+
+        if len(self.rows) == 0:
+            self.context, self.mask, self.state, self.input, self.pooled = contexts, mask, state, input, pooled
+        else:
+            time = max(self.context.size(0), contexts.size(0))
+            self.context = torch.cat([pad_time(self.context, time, 0), pad_time(contexts, time, 0)], dim=1)
+            self.mask = torch.cat([pad_time(self.mask.t(), time, True), pad_time(mask.t(), time, True)], dim=1).t()
+            self.state = map_state(lambda *s: torch.cat(s, dim=1), self.state, state)
+            self.input = torch.cat([self.input, input])
+            self.pooled = torch.cat([self.pooled, pooled])
+        self.rows += [{'tag': tags[i], 'source': sources[i], 'outputs': [], 'alignments': []} for i in order]
+
+    def step(self):
+        """One decoder step for every row; returns (tag, result) for the rows that finished."""
+        model, config = self.model, self.config
+        with self.predictor.lock, torch.no_grad(), utils.autocast(config):
+            model.init_context(self.context, self.mask)
+            scores, hidden, self.state, weights = model.decoder(self.input, self.state)
+            self.input = scores.max(1)[1]
+            self.pooled = torch.max(self.pooled, hidden.float())
+
+        finished = []
+        for j, (w, a) in enumerate(zip(self.input.tolist(), weights.max(1)[1].tolist())):
+            row = self.rows[j]
+            row['outputs'].append(w)
+            row['alignments'].append(a)
+            if (w == utils.EOS and config.until_eos) or len(row['outputs']) == config.max_time_step:
+                finished.append(j)
+        if len(finished) == 0:
+            return []
+
+        index = torch.LongTensor(finished).to(self.pooled.device)
+        with torch.no_grad(), utils.autocast(config):
+            label_scores = model.classify(self.pooled.index_select(0, index).unsqueeze(0))
+        probs = torch.nn.functional.softmax(label_scores.float() / config.temperature, dim=1).tolist()
+        results = []
+        for j, p in zip(finished, probs):
+            row = self.rows[j]
+            results.append((row['tag'], self.predictor.result(row['source'], row['outputs'],
+                                                              row['alignments'], p)))
+        self.evict(set(finished))
+        return results
+
+    def evict(self, finished):
+        keep = [j for j in range(len(self.rows)) if j not in finished]
+        self.rows = [self.rows[j] for j in keep]
+        if len(keep) == 0:
+            self.context = self.mask = self.state = self.input = self.pooled = None
+            return
+        index = torch.LongTensor(keep).to(self.input.device)
+        # the longest remaining context bounds the padded time
+        time = int((~self.mask.index_select(0, index)).sum(1).max())
+        self.context = self.context[:time].index_select(1, index)
+        self.mask = self.mask[:, :time].index_select(0, index)
+        self.state = map_state(lambda s: s.index_select(1, index), self.state)
+        self.input = self.input.index_select(0, index)
+        self.pooled = self.pooled.index_select(0, index)
+
+    def clear(self):
+        """Drop every row, returning their tags."""
+        tags = [row['tag'] for row in self.rows]
+        self.evict(set(range(len(self.rows))))
+        return tags
+
+
+def pad_time(x, time, value):
+    """Pad the time-major `x` to `time` steps with `value`."""
+    if x.size(0) == time:
+        return x
+    padding = x.new_full((time - x.size(0),) + tuple(x.size()[1:]), value)
+    return torch.cat([x, padding], dim=0)
+
+
+def map_state(fn, *states):
+    """Apply `fn` to decoder states, which are (h, c) pairs for LSTMs."""
+    if isinstance(states[0], tuple):
+        return tuple(fn(*s) for s in zip(*states))
+    return fn(*states)
@@ -0,0 +1,159 @@
+'''
+ Temperature scaling of the rating probabilities of a trained label or
+ classification model.
+
+ The rating scores of the validation set are computed once and a single
+ temperature dividing them is fitted to minimize their negative
+ log-likelihood. With -save it is stored in the checkpoint, where
+ inference.py, predict.py, server.py and label_export.py pick it up.
+'''
+
+import torch
+import torch.utils.data
+
+import os
+import argparse
+import pickle
+import time
+
+import opts
+import models
+import utils
+
+parser = argparse.ArgumentParser(description='label_calibrate.py')
+opts.model_opts(parser)
+parser.add_argument('-max_iter', type=int, default=100, help="LBFGS iterations")
+parser.add_argument('-bins', type=int, default=15, help="confidence bins of the expected calibration error")
+parser.add_argument('-save', action='store_true', help="store the temperature in the -restore checkpoint")
+
+opt = parser.parse_args()
+config = utils.read_config(opt.config)
+torch.manual_seed(opt.seed)
+opts.convert_to_config(opt, config)
+
+# cuda
+use_cuda = torch.cuda.is_available() and len(opt.gpus) > 0
+config.use_cuda = use_cuda
+if use_cuda:
+    torch.cuda.set_device(opt.gpus[0])
+    torch.cuda.manual_seed(opt.seed)
+
+
+def load_data():
+    print('loading data...\n')
+    datas = pickle.load(open(config.data+'data.pkl', 'rb'))
+
+    validset = utils.LabelDataset(datas['test'], char=config.char)
+
+    src_vocab = datas['dict']['src']
+    tgt_vocab = datas['dict']['tgt']
+    config.src_vocab_size = src_vocab.size()
+    config.tgt_vocab_size = tgt_vocab.size()
+
+    if hasattr(config, 'valid_batch_size'):
+        valid_batch_size = config.valid_batch_size
+    else:
+        valid_batch_size = config.batch_size
+    validloader = torch.utils.data.DataLoader(dataset=validset,
+                                              batch_size=valid_batch_size,
+                                              shuffle=False,
+                                              num_workers=0,
+                                              collate_fn=utils.label_sorted_padding)
+    validloader = utils.BatchCache(validloader, path=opt.valid_cache,
+                                   key=(validset.srcF, len(validset), valid_batch_size, validset.stamp()))
+
+    return {'validset': validset, 'validloader': validloader}
+
+
+def build_model(checkpoints):
+    print('building model...\n')
+    model = getattr(models, opt.model)(config)
+    model.load_state_dict(checkpoints['model'])
+    if use_cuda:
+        model.cuda()
+    model.eval()
+    return model
+
+
+def build_log():
+    if not os.path.exists(config.logF):
+        os.mkdir(config.logF)
+    if opt.log == '':
+        log_path = config.logF + 'calibrate_' + str(int(time.time() * 1000)) + '/'
+    else:
+        log_path = config.logF + opt.log + '/'
+    if not os.path.exists(log_path):
+        os.mkdir(log_path)
+    print_log = utils.print_log(log_path + 'log.txt')
+    return print_log, log_path
+
+
+def collect_scores(model, validloader):
+    """Rating scores and labels of the validation set, in dataset order."""
+    scores, labels = [], []
+    with torch.no_grad(), utils.autocast(config):
+        for src, tgt, label, src_len, tgt_len, reverse_indices, original_src, original_tgt in validloader:
+            if use_cuda:
+                src, src_len = src.cuda(), src_len.cuda()
+                label, reverse_indices = label.cuda(), reverse_indices.cuda()
+            scores.append(model.sentiment_logits(src, src_len, reverse_indices, until_eos=config.until_eos).float())
+            labels.append(torch.index_select(label, dim=0, index=reverse_indices))
+    return torch.cat(scores), torch.cat(labels)
+
+
+def fit_temperature(scores, labels):
+    # the log keeps the temperature positive
+    log_t = torch.zeros(1, device=scores.device, requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=opt.max_iter, line_search_fn='strong_wolfe')
+
+    def closure():
+        optimizer.zero_grad()
+        loss = torch.nn.functional.cross_entropy(scores / log_t.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return float(log_t.exp())
+
+
+def calibration(scores, labels, temperature):
+    """Negative log-likelihood, expected calibration error and accuracy."""
+    probs = torch.nn.functional.softmax(scores / temperature, dim=1)
+    nll = torch.nn.functional.cross_entropy(scores / temperature, labels)
+    confidence, predicts = probs.max(1)
+    correct = predicts.eq(labels).float()
+    ece = 0.0
+    edges = torch.linspace(0, 1, opt.bins + 1).tolist()
+    for low, high in zip(edges[:-1], edges[1:]):
+        inside = (confidence > low) & (confidence <= high)
+        if bool(inside.any()):
+            ece += float(inside.float().mean()) * abs(float(confidence[inside].mean() - correct[inside].mean()))
+    return float(nll), ece * 100, float(correct.mean()) * 100
+
+
+def main():
+    print('loading checkpoint...\n')
+    checkpoints = torch.load(opt.restore, map_location='cpu')
+
+    datas = load_data()
+    print_log, log_path = build_log()
+    model = build_model(checkpoints)
+
+    start = time.time()
+    scores, labels = collect_scores(model, datas['validloader'])
+    print_log('scored %d examples in %.1fs\n' % (len(datas['validset']), time.time() - start))
+
+    temperature = fit_temperature(scores, labels)
+    print_log('\n%12s %8s %8s %8s\n' % ('temperature', 'NLL', 'ECE', 'acc-5'))
+    for t in (1.0, temperature):
+        print_log('%12.4f %8.4f %8.2f %8.2f\n' % ((t,) + calibration(scores, labels, t)))
+
+    if opt.save:
+        checkpoints['temperature'] = temperature
+        # an interrupted write leaves the trained checkpoint as it was
+        utils.atomic_save(checkpoints, opt.restore)
+        print_log('temperature stored in %s\n' % opt.restore)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+'''
+ Export a trained label model for CPU inference.
+
+ python label_export.py -config movie.yaml -restore best.pt -out movie_int8.pt -format int8 -eval
+ python label_export.py -config movie.yaml -restore best.pt -out movie.jit -format script -eval
+ python label_export.py -config movie.yaml -restore best.pt -out movie_onnx/ -format onnx
+ python label_export.py -config movie.yaml -restore best.pt -out movie_slim.pt -format slim -dtype bfloat16
+'''
+
+import torch
+import torch.utils.data
+from torch.autograd import Variable
+
+import io
+import os
+import json
+import argparse
+import pickle
+import time
+
+import opts
+import models
+import utils
+
+parser = argparse.ArgumentParser(description='label_export.py')
+opts.model_opts(parser)
+parser.add_argument('-out', required=True, type=str, help="path of the exported model")
+parser.add_argument('-format', default='int8', type=str,
+                    help="export format: int8, script, onnx, slim")
+parser.add_argument('-dtype', default='float32', type=str,
+                    help="weight type of slim exports: float32, float16 or bfloat16")
+parser.add_argument('-opset', type=int, default=14, help="ONNX opset version")
+parser.add_argument('-eval', action='store_true',
+                    help="compare the exported int8 or script model with the float one on the test set")
+
+opt = parser.parse_args()
+config = utils.read_config(opt.config)
+torch.manual_seed(opt.seed)
+opts.convert_to_config(opt, config)
+
+# exported models are meant for CPU hosts
+config.use_cuda = False
+
+
+def load_data():
+    print('loading data...\n')
+    datas = pickle.load(open(config.data+'data.pkl', 'rb'))
+
+    validset = utils.LabelDataset(datas['test'], char=config.char)
+
+    src_vocab = datas['dict']['src']
+    tgt_vocab = datas['dict']['tgt']
+    config.src_vocab_size = src_vocab.size()
+    config.tgt_vocab_size = tgt_vocab.size()
+
+    if hasattr(config, 'valid_batch_size'):
+        valid_batch_size = config.valid_batch_size
+    else:
+        valid_batch_size = config.batch_size
+    validloader = torch.utils.data.DataLoader(dataset=validset,
+                                              batch_size=valid_batch_size,
+                                              shuffle=False,
+                                              num_workers=0,
+                                              collate_fn=utils.label_sorted_padding)
+    validloader = utils.BatchCache(validloader, path=opt.valid_cache,
+                                   key=(validset.srcF, len(validset), valid_batch_size, validset.stamp()))
+
+    return {'validset': validset, 'validloader': validloader, 'src_vocab': src_vocab, 'tgt_vocab': tgt_vocab}
+
+
+def build_model(checkpoints):
+    print('building model...\n')
+    model = getattr(models, opt.model)(config)
+    model.load_state_dict(checkpoints['model'])
+    model.eval()
+    return model
+
+
+def build_log():
+    if not os.path.exists(config.logF):
+        os.mkdir(config.logF)
+    if opt.log == '':
+        log_path = config.logF + 'export_' + str(int(time.time() * 1000)) + '/'
+    else:
+        log_path = config.logF + opt.log + '/'
+    if not os.path.exists(log_path):
+        os.mkdir(log_path)
+    print_log = utils.print_log(log_path + 'log.txt')
+    return print_log, log_path
+
+
+def export_int8(model, path, temperature=1.0):
+    qmodel = models.quantize_dynamic(model)
+    torch.save({'model': qmodel.state_dict(), 'config': dict(config), 'format': 'int8',
+                'temperature': temperature}, path)
+    return qmodel
+
+
+def export_script(model, path):
+    scripted = models.script_label(model)
+    torch.jit.save(scripted, path)
+    return scripted
+
+
+def export_onnx(model, path):
+    """
+    Writes encoder.onnx, step.onnx (one decoder step) and classifier.onnx to
+    the directory `path`, plus the settings onnx_predict.py needs.
+    """
+    if not os.path.exists(path):
+        os.mkdir(path)
+    model.eval()
+    encoder = models.ScriptedEncoder(model.encoder, enforce_sorted=True)
+    decoder = models.ScriptedLabel(model).decoder
+
+    src = torch.randint(4, config.src_vocab_size, (7, 2))
+    lengths = torch.LongTensor([7, 5])
+    with torch.no_grad():
+        contexts, h, c = encoder(src, lengths)
+    context = contexts.transpose(0, 1).contiguous()
+    input = torch.LongTensor([utils.BOS, utils.BOS])
+
+    torch.onnx.export(encoder, (src, lengths), os.path.join(path, 'encoder.onnx'),
+                      input_names=['src', 'lengths'], output_names=['contexts', 'h', 'c'],
+                      dynamic_axes={'src': {0: 'time', 1: 'batch'}, 'lengths': {0: 'batch'},
+                                    'contexts': {0: 'time', 1: 'batch'}, 'h': {1: 'batch'}, 'c': {1: 'batch'}},
+                      opset_version=opt.opset)
+    torch.onnx.export(decoder, (input, h, c, context), os.path.join(path, 'step.onnx'),
+                      input_names=['input', 'h', 'c', 'context'],
+                      output_names=['scores', 'hidden', 'h_out', 'c_out', 'attention'],
+                      dynamic_axes={'input': {0: 'batch'}, 'h': {1: 'batch'}, 'c': {1: 'batch'},
+                                    'context': {0: 'batch', 1: 'time'}, 'scores': {0: 'batch'},
+                                    'hidden': {0: 'batch'}, 'h_out': {1: 'batch'}, 'c_out': {1: 'batch'},
+                                    'attention': {0: 'batch', 1: 'time'}},
+                      opset_version=opt.opset)
+    torch.onnx.export(model._classifier, (contexts.max(0)[0],), os.path.join(path, 'classifier.onnx'),
+                      input_names=['state'], output_names=['scores'],
+                      dynamic_axes={'state': {0: 'batch'}, 'scores': {0: 'batch'}},
+                      opset_version=opt.opset)
+
+    with open(os.path.join(path, 'config.json'), 'w') as f:
+        json.dump({'max_time_step': config.max_time_step, 'pad': utils.PAD, 'unk': utils.UNK,
+                   'bos': utils.BOS, 'eos': utils.EOS}, f, indent=2)
+
+
+def encode_vocab(vocab):
+    """The words of `vocab` in id order, newline separated, as a byte tensor."""
+    words = '\n'.join(vocab.idxToLabel[i] for i in range(vocab.size()))
+    return torch.ByteTensor(bytearray(words.encode('utf8')))
+
+
+def export_slim(model, src_vocab, tgt_vocab, path, temperature=1.0):
+    """
+    Weights, vocabularies and settings only, readable with torch.load(mmap=True,
+    weights_only=True) so that loading is dominated by page-ins.
+    """
+    dtype = getattr(torch, opt.dtype)
+    state_dict, converted = {}, {}
+    for k, v in model.state_dict().items():
+        # shared embeddings are converted, and stored, once
+        if v.data_ptr() not in converted:
+            converted[v.data_ptr()] = v.detach().to(dtype).contiguous() if v.is_floating_point() else v
+        state_dict[k] = converted[v.data_ptr()]
+    settings = {k: v for k, v in config.items() if isinstance(v, (str, int, float, bool, list, type(None)))}
+    torch.save({'model': state_dict, 'config': settings, 'format': 'slim', 'dtype': opt.dtype,
+                'src_vocab': encode_vocab(src_vocab), 'tgt_vocab': encode_vocab(tgt_vocab),
+                'temperature': temperature}, path)
+
+
+def serialized_size(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def sample(model, src, src_len, label, reverse_indices):
+    if isinstance(model, torch.jit.ScriptModule):
+        # scripted bundles decode greedily and keep the order of the batch
+        ids, alignments, label_scores = model(src, src_len, config.max_time_step)
+        predicts = label_scores.max(1)[1]
+        correct_five = predicts.eq(label).float().sum()
+        correct_two = predicts.ge(3).eq(label.ge(3)).float().sum()
+        return (ids.index_select(0, reverse_indices), alignments.index_select(0, reverse_indices),
+                correct_five, correct_two)
+    if config.beam_size > 1:
+        return model.beam_sample(src, src_len, label, beam_size=config.beam_size, reverse_indices=reverse_indices)
+    return model.sample(src, src_len, label, reverse_indices=reverse_indices)
+
+
+def decode(model, validloader):
+    """Decode the test set, returning samples, alignments, correct counts and seconds."""
+    result = {'samples': [], 'alignments': [], 'correct_5': 0, 'correct_2': 0}
+    start = time.time()
+    with torch.no_grad():
+        for src, tgt, label, src_len, tgt_len, reverse_indices, original_src, original_tgt in validloader:
+            src, src_len = Variable(src, volatile=True), Variable(src_len, volatile=True)
+            label, reverse_indices = Variable(label, volatile=True), Variable(reverse_indices, volatile=True)
+            samples, alignment, c_5, c_2 = sample(model, src, src_len, label, reverse_indices)
+            result['samples'] += [[int(w) for w in s] for s in samples]
+            result['alignments'] += [[int(i) for i in a] for a in alignment]
+            result['correct_5'] += float(c_5)
+            result['correct_2'] += float(c_2)
+    result['time'] = time.time() - start
+    return result
+
+
+def score(result, validloader, tgt_vocab, log_path):
+    source = [s for batch in validloader for s in batch[6]]
+    reference = [t for batch in validloader for t in batch[7]]
+    candidate = [tgt_vocab.convertToLabels(s, utils.EOS) for s in result['samples']]
+    if config.unk and config.attention != 'None':
+        candidate = utils.replace_unk(source, candidate, result['alignments'])
+
+    if not os.path.exists(log_path):
+        os.mkdir(log_path)
+    f_score, _, _ = utils.rouge_scores(reference, candidate, log_path)
+    return f_score + [result['correct_5'] * 100.0 / len(reference),
+                      result['correct_2'] * 100.0 / len(reference)]
+
+
+def main():
+    print('loading checkpoint...\n')
+    checkpoints = torch.load(opt.restore, map_location='cpu')
+
+    datas = load_data()
+    model = build_model(checkpoints)
+    # the rating temperature fitted by label_calibrate.py goes with the export
+    temperature = checkpoints.get('temperature', 1.0)
+
+    if opt.format == 'int8':
+        exported = export_int8(model, opt.out, temperature)
+    elif opt.format == 'script':
+        exported = export_script(model, opt.out)
+    elif opt.format == 'onnx':
+        exported = export_onnx(model, opt.out)
+    elif opt.format == 'slim':
+        exported = export_slim(model, datas['src_vocab'], datas['tgt_vocab'], opt.out, temperature)
+    else:
+        raise ValueError("unknown export format %s" % opt.format)
+    print('exported %s model to %s\n' % (opt.format, opt.out))
+
+    if opt.eval and exported is not None:
+        print_log, log_path = build_log()
+        rows = []
+        for name, m in (('float', model), (opt.format, exported)):
+            result = decode(m, datas['validloader'])
+            rows.append((name, serialized_size(m) / 2**20) +
+                        tuple(score(result, datas['validloader'], datas['tgt_vocab'], log_path + name + '/')) +
+                        (len(datas['validset']) / result['time'],))
+
+        print_log('\n%-8s %8s %8s %8s %8s %8s %8s %10s\n'
+                  % ('model', 'MB', 'R-1', 'R-2', 'R-L', 'acc-5', 'acc-2', 'decoded/s'))
+        for row in rows:
+            print_log('%-8s %8.1f %8.2f %8.2f %8.2f %8.2f %8.2f %10.1f\n' % row)
+
+
+if __name__ == '__main__':
+    main()
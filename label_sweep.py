@@ -0,0 +1,211 @@
+'''
+ Decoding hyper-parameter sweep for the label model.
+
+ The validation set is encoded once; every combination of -beam_sizes,
+ -length_norms and -max_time_steps is then decoded from the cached encoder
+ outputs and scored with ROUGE and sentiment accuracy.
+'''
+
+import torch
+import torch.utils.data
+from torch.autograd import Variable
+
+import os
+import argparse
+import pickle
+import time
+
+import opts
+import models
+import utils
+
+parser = argparse.ArgumentParser(description='label_sweep.py')
+opts.model_opts(parser)
+parser.add_argument('-beam_sizes', default=[1], nargs='+', type=int,
+                    help="beam sizes to try")
+parser.add_argument('-length_norms', default=[0], nargs='+', type=int,
+                    help="length normalization settings (0 or 1) to try, only used by beam search")
+parser.add_argument('-max_time_steps', default=[], nargs='+', type=int,
+                    help="decoding lengths to try, max_time_step of the config by default")
+
+opt = parser.parse_args()
+config = utils.read_config(opt.config)
+torch.manual_seed(opt.seed)
+opts.convert_to_config(opt, config)
+
+# cuda
+use_cuda = torch.cuda.is_available() and len(opt.gpus) > 0
+config.use_cuda = use_cuda
+if use_cuda:
+    torch.cuda.set_device(opt.gpus[0])
+    torch.cuda.manual_seed(opt.seed)
+
+
+def load_data():
+    print('loading data...\n')
+    datas = pickle.load(open(config.data+'data.pkl', 'rb'))
+
+    validset = utils.LabelDataset(datas['test'], char=config.char)
+
+    src_vocab = datas['dict']['src']
+    tgt_vocab = datas['dict']['tgt']
+    config.src_vocab_size = src_vocab.size()
+    config.tgt_vocab_size = tgt_vocab.size()
+
+    if hasattr(config, 'valid_batch_size'):
+        valid_batch_size = config.valid_batch_size
+    else:
+        valid_batch_size = config.batch_size
+    validloader = torch.utils.data.DataLoader(dataset=validset,
+                                              batch_size=valid_batch_size,
+                                              shuffle=False,
+                                              num_workers=0,
+                                              collate_fn=utils.label_sorted_padding)
+    validloader = utils.BatchCache(validloader, path=opt.valid_cache,
+                                   key=(validset.srcF, len(validset), valid_batch_size, validset.stamp()))
+
+    return {'validset': validset, 'validloader': validloader, 'tgt_vocab': tgt_vocab}
+
+
+def build_model(checkpoints):
+    print('building model...\n')
+    model = getattr(models, opt.model)(config)
+    model.load_state_dict(checkpoints['model'])
+    if use_cuda:
+        model.cuda()
+    model.eval()
+    return model
+
+
+def build_log():
+    if not os.path.exists(config.logF):
+        os.mkdir(config.logF)
+    if opt.log == '':
+        log_path = config.logF + 'sweep_' + str(int(time.time() * 1000)) + '/'
+    else:
+        log_path = config.logF + opt.log + '/'
+    if not os.path.exists(log_path):
+        os.mkdir(log_path)
+    print_log = utils.print_log(log_path + 'log.txt')
+    return print_log, log_path
+
+
+def encode(model, validloader):
+    """Run the encoder once over the whole validation set."""
+    cache = []
+    for src, tgt, label, src_len, tgt_len, reverse_indices, original_src, original_tgt in validloader:
+        src = Variable(src, volatile=True)
+        if use_cuda:
+            src = src.cuda()
+            label = label.cuda()
+            reverse_indices = reverse_indices.cuda()
+        contexts, state = model.encoder(src.t(), src_len.tolist())
+        cache.append({'contexts': contexts, 'state': state, 'label': label,
+                      'reverse_indices': reverse_indices,
+                      'original_src': original_src, 'original_tgt': original_tgt})
+    return cache
+
+
+def decode_greedy(model, cache, max_time_steps):
+    """
+    Greedy decoding of shorter lengths is a prefix of the longest one, so the
+    batch is decoded once and every length in the grid is cut out of it,
+    together with the running max-pool at that step.
+    """
+    results = {t: {'samples': [], 'alignments': [], 'correct_5': 0, 'correct_2': 0}
+               for t in max_time_steps}
+    for batch in cache:
+        contexts, label, reverse_indices = batch['contexts'], batch['label'], batch['reverse_indices']
+        outputs, attn_matrix, pooled_at = [], [], {}
+        for predicted, attn_weights, pooled in model.greedy_steps(contexts, batch['state'], max(max_time_steps),
+                                                                  config.until_eos):
+            outputs.append(predicted)
+            attn_matrix.append(attn_weights)
+            if len(outputs) in results:
+                pooled_at[len(outputs)] = pooled
+        sample_ids = torch.index_select(torch.stack(outputs), dim=1, index=reverse_indices).t()
+        alignments = torch.index_select(torch.stack(attn_matrix).max(2)[1], dim=1, index=reverse_indices).t()
+        for t in max_time_steps:
+            # with -until_eos decoding may end before t
+            predicts = model.classify(pooled_at.get(t, pooled).unsqueeze(0)).max(1)[1]
+            c_5, c_2 = model.count_correct(predicts, label)
+            results[t]['samples'] += sample_ids[:, :t].tolist()
+            results[t]['alignments'] += alignments[:, :t].tolist()
+            results[t]['correct_5'] += float(c_5)
+            results[t]['correct_2'] += float(c_2)
+    return results
+
+
+def decode_beam(model, cache, beam_size, length_norm, max_time_step):
+    result = {'samples': [], 'alignments': [], 'correct_5': 0, 'correct_2': 0}
+    for batch in cache:
+        hyps, attn, label_scores = model.beam_decode(batch['contexts'], batch['state'], beam_size,
+                                                     max_time_step, length_norm)
+        c_5, c_2 = model.count_correct(label_scores.max(1)[1], batch['label'])
+        for j in batch['reverse_indices'].tolist():
+            result['samples'].append(hyps[j])
+            result['alignments'].append(attn[j].tolist())
+        result['correct_5'] += float(c_5)
+        result['correct_2'] += float(c_2)
+    return result
+
+
+def score(result, cache, tgt_vocab, log_path):
+    source = [s for batch in cache for s in batch['original_src']]
+    reference = [t for batch in cache for t in batch['original_tgt']]
+    candidate = [tgt_vocab.convertToLabels(s, utils.EOS) for s in result['samples']]
+    if config.unk and config.attention != 'None':
+        candidate = utils.replace_unk(source, candidate, result['alignments'])
+
+    if not os.path.exists(log_path):
+        os.mkdir(log_path)
+    f_score, _, _ = utils.rouge_scores(reference, candidate, log_path)
+    return f_score + [result['correct_5'] * 100.0 / len(reference),
+                      result['correct_2'] * 100.0 / len(reference)]
+
+
+def main():
+    print('loading checkpoint...\n')
+    checkpoints = torch.load(opt.restore)
+
+    datas = load_data()
+    print_log, log_path = build_log()
+    model = build_model(checkpoints)
+
+    max_time_steps = opt.max_time_steps or [config.max_time_step]
+    # length normalization only matters for beam search
+    grid = [(1, 0, t) for t in max_time_steps] if 1 in opt.beam_sizes else []
+    grid += [(b, n, t) for b in opt.beam_sizes if b > 1
+             for n in sorted(set(opt.length_norms)) for t in max_time_steps]
+
+    rows = []
+    with torch.no_grad(), utils.autocast(config):
+        print('encoding...\n')
+        start = time.time()
+        cache = encode(model, datas['validloader'])
+        print_log('encoded %d examples in %.1fs\n' % (len(datas['validset']), time.time() - start))
+
+        if 1 in opt.beam_sizes:
+            start = time.time()
+            greedy = decode_greedy(model, cache, max_time_steps)
+            print_log('greedy decoding in %.1fs\n' % (time.time() - start))
+        for beam_size, length_norm, max_time_step in grid:
+            if beam_size == 1:
+                result = greedy[max_time_step]
+            else:
+                start = time.time()
+                result = decode_beam(model, cache, beam_size, bool(length_norm), max_time_step)
+                print_log('beam %d, length_norm %d, steps %d decoded in %.1fs\n'
+                          % (beam_size, length_norm, max_time_step, time.time() - start))
+            name = 'beam%d_norm%d_steps%d/' % (beam_size, length_norm, max_time_step)
+            rows.append((beam_size, length_norm, max_time_step) +
+                        tuple(score(result, cache, datas['tgt_vocab'], log_path + name)))
+
+    print_log('\n%6s %6s %6s %8s %8s %8s %8s %8s\n'
+              % ('beam', 'norm', 'steps', 'R-1', 'R-2', 'R-L', 'acc-5', 'acc-2'))
+    for row in rows:
+        print_log('%6d %6d %6d %8.2f %8.2f %8.2f %8.2f %8.2f\n' % row)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,318 +1,578 @@
-'''
- @Date  : 2018/1/23
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
-'''
-
-import torch
-import torch.utils.data
-from torch.autograd import Variable
-
-import os
-import argparse
-import pickle
-import time
-from collections import OrderedDict
-import math
-import numpy as np
-
-import opts
-import models
-import utils
-
-parser = argparse.ArgumentParser(description='train.py')
-opts.model_opts(parser)
-
-opt = parser.parse_args()
-config = utils.read_config(opt.config)
-torch.manual_seed(opt.seed)
-opts.convert_to_config(opt, config)
-
-# cuda
-use_cuda = torch.cuda.is_available() and len(opt.gpus) > 0
-config.use_cuda = use_cuda
-if use_cuda:
-    torch.cuda.set_device(opt.gpus[0])
-    torch.cuda.manual_seed(opt.seed)
-    torch.backends.cudnn.benchmark = True
-
-
-def load_data():
-    print('loading data...\n')
-    datas = pickle.load(open(config.data+'data.pkl', 'rb'))
-    datas['train']['length'] = int(datas['train']['length'] * opt.scale)
-
-    trainset = utils.LabelDataset(datas['train'], char=config.char)
-    validset = utils.LabelDataset(datas['test'], char=config.char)
-
-    src_vocab = datas['dict']['src']
-    tgt_vocab = datas['dict']['tgt']
-    config.src_vocab_size = src_vocab.size()
-    config.tgt_vocab_size = tgt_vocab.size()
-
-    trainloader = torch.utils.data.DataLoader(dataset=trainset,
-                                              batch_size=config.batch_size,
-                                              shuffle=True,
-                                              num_workers=0,
-                                              collate_fn=utils.label_padding)
-    if hasattr(config, 'valid_batch_size'):
-        valid_batch_size = config.valid_batch_size
-    else:
-        valid_batch_size = config.batch_size
-    validloader = torch.utils.data.DataLoader(dataset=validset,
-                                              batch_size=valid_batch_size,
-                                              shuffle=False,
-                                              num_workers=0,
-                                              collate_fn=utils.label_padding)
-
-    return {'trainset': trainset, 'validset': validset,
-            'trainloader': trainloader, 'validloader': validloader,
-            'src_vocab': src_vocab, 'tgt_vocab': tgt_vocab}
-
-
-def build_model(checkpoints, print_log):
-
-    # model
-    print('building model...\n')
-    model = getattr(models, opt.model)(config)
-    if checkpoints is not None:
-        model.load_state_dict(checkpoints['model'])
-    if opt.pretrain:
-        print('loading checkpoint from %s' % opt.pretrain)
-        pre_ckpt = torch.load(opt.pretrain)['model']
-        pre_ckpt = OrderedDict({key[8:]: pre_ckpt[key] for key in pre_ckpt if key.startswith('encoder')})
-        print(model.encoder.state_dict().keys())
-        print(pre_ckpt.keys())
-        model.encoder.load_state_dict(pre_ckpt)
-    if use_cuda:
-        model.cuda()
-
-    # optimizer
-    if checkpoints is not None:
-        optim = checkpoints['optim']
-        optim.lr_decay = config.learning_rate_decay
-        optim.start_decay_at = config.start_decay_at
-        optim.learning_rate = config.learning_rate
-        optim.max_grad_norm = config.max_grad_norm
-    else:
-        optim = models.Optim(config.optim, config.learning_rate, config.max_grad_norm,
-                             lr_decay=config.learning_rate_decay, start_decay_at=config.start_decay_at)
-        optim.set_parameters(model.parameters())
-
-    # print log
-    param_count = 0
-    for param in model.parameters():
-        param_count += param.view(-1).size()[0]
-    for k, v in config.items():
-        print_log("%s:\t%s\n" % (str(k), str(v)))
-    print_log("\n")
-    print_log(repr(model) + "\n\n")
-    print_log('total number of parameters: %d\n\n' % param_count)
-
-    return model, optim, print_log
-
-
-def train_model(model, datas, optim, epoch, params):
-
-    model.train()
-    trainloader = datas['trainloader']
-
-    for src, tgt, label, src_len, tgt_len, original_src, original_tgt in trainloader:
-
-        model.zero_grad()
-
-        src = Variable(src)
-        tgt = Variable(tgt)
-        label = Variable(label)
-        src_len = Variable(src_len)
-        if config.use_cuda:
-            src = src.cuda()
-            tgt = tgt.cuda()
-            label = label.cuda()
-            src_len = src_len.cuda()
-        lengths, indices = torch.sort(src_len, dim=0, descending=True)
-        src = torch.index_select(src, dim=0, index=indices)
-        tgt = torch.index_select(tgt, dim=0, index=indices)
-        label = torch.index_select(label, dim=0, index=indices)
-        dec = tgt[:, :-1]
-        targets = tgt[:, 1:]
-
-        try:
-            loss, outputs = model(src, lengths, dec, targets, label)
-
-            if outputs is not None:
-                pred = outputs.max(2)[1]
-                targets = targets.t()
-                num_correct = pred.data.eq(targets.data).masked_select(targets.ne(utils.PAD).data).sum()
-                num_total = targets.ne(utils.PAD).data.sum()
-            else:
-                num_correct = 0
-                num_total = 1
-
-            loss.backward()
-            optim.step()
-
-            params['report_loss'] += loss.data
-            params['report_correct'] += num_correct
-            params['report_total'] += num_total
-
-        except RuntimeError as e:
-            if 'out of memory' in str(e):
-                print('| WARNING: ran out of memory')
-                if hasattr(torch.cuda, 'empty_cache'):
-                    torch.cuda.empty_cache()
-            else:
-                raise e
-
-        utils.progress_bar(params['updates'], config.eval_interval)
-        params['updates'] += 1
-
-        if params['updates'] % config.eval_interval == 0:
-            params['log']("epoch: %3d, loss: %6.3f, time: %6.3f, updates: %8d, accuracy: %2.2f\n"
-                          % (epoch, params['report_loss'], time.time()-params['report_time'],
-                             params['updates'], params['report_correct'] * 100.0 / params['report_total']))
-            print('evaluating after %d updates...\r' % params['updates'])
-            score = eval_model(model, datas, params)
-
-            if type(score) == 'dict':
-                for metric in config.metrics:
-                    params[metric].append(score[metric])
-                    if score[metric] >= max(params[metric]):
-                        save_model(params['log_path']+'best_'+metric+'_checkpoint.pt', model, optim, params['updates'])
-
-            model.train()
-            params['report_loss'], params['report_time'] = 0, time.time()
-            params['report_correct'], params['report_total'] = 0, 0
-
-        if params['updates'] % config.save_interval == 0:
-            save_model(params['log_path']+'checkpoint.pt', model, optim, params['updates'])
-
-    optim.updateLearningRate(score=0, epoch=epoch)
-
-
-def eval_model(model, datas, params):
-
-    model.eval()
-    reference, candidate, source, alignments = [], [], [], []
-    correct_2, correct_5 = 0, 0
-    count, total_count = 0, len(datas['validset'])
-    validloader = datas['validloader']
-    tgt_vocab = datas['tgt_vocab']
-
-    for src, tgt, label, src_len, tgt_len, original_src, original_tgt in validloader:
-
-        src = Variable(src, volatile=True)
-        src_len = Variable(src_len, volatile=True)
-        label = Variable(label, volatile=True)
-        if config.use_cuda:
-            src = src.cuda()
-            src_len = src_len.cuda()
-            label = label.cuda()
-
-        if config.beam_size > 1:
-            samples, alignment, c_5, c_2 = model.beam_sample(src, src_len, label, beam_size=config.beam_size)
-        else:
-            samples, alignment, c_5, c_2 = model.sample(src, src_len, label)
-
-        if samples is not None:
-            candidate += [tgt_vocab.convertToLabels(s, utils.EOS) for s in samples]
-            source += original_src
-            reference += original_tgt
-
-        if alignment is not None:
-            alignments += [align for align in alignment]
-
-        count += len(original_src)
-        correct_2 += c_2
-        correct_5 += c_5
-        utils.progress_bar(count, total_count)
-
-    if config.unk and config.attention != 'None' and len(candidate) > 0:
-        cands = []
-        for s, c, align in zip(source, candidate, alignments):
-            cand = []
-            for word, idx in zip(c, align):
-                if word == utils.UNK_WORD and idx < len(s):
-                    try:
-                        cand.append(s[idx])
-                    except:
-                        cand.append(word)
-                        print("%d %d\n" % (len(s), idx))
-                else:
-                    cand.append(word)
-            cands.append(cand)
-        candidate = cands
-
-    accuracy_five = correct_5 * 100.0 / total_count
-    accuracy_two = correct_2 * 100.0 / total_count
-    print("acc = %.2f, %.2f" % (accuracy_five, accuracy_two))
-
-    if len(candidate) > 0:
-        score = {}
-        for metric in config.metrics:
-            try:
-                score[metric] = getattr(utils, metric)(reference, candidate, params['log_path'], params['log'], config)
-            except:
-                score[metric] = 0
-        return score
-    else:
-        return 0
-
-
-def save_model(path, model, optim, updates):
-    model_state_dict = model.state_dict()
-    checkpoints = {
-        'model': model_state_dict,
-        'config': config,
-        'optim': optim,
-        'updates': updates}
-    torch.save(checkpoints, path)
-
-
-def build_log():
-    # log
-    if not os.path.exists(config.logF):
-        os.mkdir(config.logF)
-    if opt.log == '':
-        log_path = config.logF + str(int(time.time() * 1000)) + '/'
-    else:
-        log_path = config.logF + opt.log + '/'
-    if not os.path.exists(log_path):
-        os.mkdir(log_path)
-    print_log = utils.print_log(log_path + 'log.txt')
-    return print_log, log_path
-
-
-def main():
-    # checkpoint
-    if opt.restore:
-        print('loading checkpoint...\n')
-        checkpoints = torch.load(opt.restore)
-    else:
-        checkpoints = None
-
-    datas = load_data()
-    print_log, log_path = build_log()
-    model, optim, print_log = build_model(checkpoints, print_log)
-
-    params = {'updates': 0, 'report_loss': 0, 'report_total': 0,
-              'report_correct': 0, 'report_time': time.time(),
-              'log': print_log, 'log_path': log_path}
-    for metric in config.metrics:
-        params[metric] = []
-    if opt.restore:
-        params['updates'] = checkpoints['updates']
-
-    if opt.mode == 'train':
-        for i in range(1, config.epoch + 1):
-            train_model(model, datas, optim, i, params)
-        for metric in config.metrics:
-            print_log("Best %s score: %.2f\n" % (metric, max(params[metric])))
-    else:
-        score = eval_model(model, datas, params)
-
-
-
-if __name__ == '__main__':
-    main()
+'''
+ @Date  : 2018/1/23
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
+'''
+
+import torch
+import torch.utils.data
+from torch.autograd import Variable
+
+import os
+import argparse
+import multiprocessing
+import pickle
+import time
+from collections import OrderedDict
+import math
+import numpy as np
+
+import opts
+import models
+import utils
+
+parser = argparse.ArgumentParser(description='train.py')
+opts.model_opts(parser)
+
+opt = parser.parse_args()
+config = utils.read_config(opt.config)
+torch.manual_seed(opt.seed)
+opts.convert_to_config(opt, config)
+
+# cuda
+use_cuda = torch.cuda.is_available() and len(opt.gpus) > 0
+config.use_cuda = use_cuda
+if use_cuda:
+    torch.cuda.set_device(opt.gpus[0])
+    torch.cuda.manual_seed(opt.seed)
+    torch.backends.cudnn.benchmark = True
+
+
+def load_data():
+    print('loading data...\n')
+    datas = pickle.load(open(config.data+'data.pkl', 'rb'))
+    datas['train']['length'] = int(datas['train']['length'] * opt.scale)
+
+    trainset = utils.LabelDataset(datas['train'], char=config.char)
+
+    src_vocab = datas['dict']['src']
+    tgt_vocab = datas['dict']['tgt']
+    config.src_vocab_size = src_vocab.size()
+    config.tgt_vocab_size = tgt_vocab.size()
+
+    # the sampler keeps the epoch permutation and position for exact resuming
+    sampler = utils.ResumableSampler(trainset, seed=opt.seed,
+                                     num_replicas=utils.get_world_size(), rank=utils.get_rank())
+    trainloader = torch.utils.data.DataLoader(dataset=trainset,
+                                              batch_size=config.batch_size,
+                                              sampler=sampler,
+                                              num_workers=0,
+                                              collate_fn=utils.label_padding)
+
+    # only the first process evaluates, the others never read the validation set
+    validset, validloader = None, None
+    if utils.get_rank() == 0:
+        validset = utils.LabelDataset(datas['test'], char=config.char)
+        if hasattr(config, 'valid_batch_size'):
+            valid_batch_size = config.valid_batch_size
+        else:
+            valid_batch_size = config.batch_size
+        validloader = torch.utils.data.DataLoader(dataset=validset,
+                                                  batch_size=valid_batch_size,
+                                                  shuffle=False,
+                                                  num_workers=0,
+                                                  collate_fn=utils.label_sorted_padding)
+        # validation batches never change, so collate them only once
+        validloader = utils.BatchCache(validloader, path=opt.valid_cache,
+                                       key=(validset.srcF, len(validset), valid_batch_size, validset.stamp()))
+
+    return {'trainset': trainset, 'validset': validset,
+            'trainloader': trainloader, 'validloader': validloader, 'sampler': sampler,
+            'src_vocab': src_vocab, 'tgt_vocab': tgt_vocab}
+
+
+def create_model(checkpoints):
+    print('building model...\n')
+    model = getattr(models, opt.model)(config)
+    if checkpoints is not None:
+        model.load_state_dict(checkpoints['model'])
+    if opt.pretrain:
+        print('loading checkpoint from %s' % opt.pretrain)
+        pre_ckpt = torch.load(opt.pretrain)['model']
+        pre_ckpt = OrderedDict({key[8:]: pre_ckpt[key] for key in pre_ckpt if key.startswith('encoder')})
+        print(model.encoder.state_dict().keys())
+        print(pre_ckpt.keys())
+        model.encoder.load_state_dict(pre_ckpt)
+    if use_cuda:
+        model.cuda()
+    return model
+
+
+def build_model(checkpoints, print_log, model=None):
+
+    # model, unless a hogwild worker got the shared one
+    if model is None:
+        model = create_model(checkpoints)
+
+    # optimizer
+    if checkpoints is not None:
+        if isinstance(checkpoints['optim'], models.Optim):
+            # checkpoints written before optimizer state dicts pickled the whole wrapper
+            optim = checkpoints['optim']
+            optim.sparse_params, optim.sparse_optimizer = [], None
+        else:
+            optim = models.Optim(config.optim, config.learning_rate, config.max_grad_norm,
+                                 lr_decay=config.learning_rate_decay, start_decay_at=config.start_decay_at)
+            optim.set_parameters(model.parameters(), sparse_params=models.sparse_parameters(model))
+            optim.load_state_dict(checkpoints['optim'])
+        optim.lr_decay = config.learning_rate_decay
+        optim.start_decay_at = config.start_decay_at
+        optim.learning_rate = config.learning_rate
+        optim.max_grad_norm = config.max_grad_norm
+    else:
+        optim = models.Optim(config.optim, config.learning_rate, config.max_grad_norm,
+                             lr_decay=config.learning_rate_decay, start_decay_at=config.start_decay_at)
+        optim.set_parameters(model.parameters(), sparse_params=models.sparse_parameters(model))
+
+    # print log
+    param_count = 0
+    for param in model.parameters():
+        param_count += param.view(-1).size()[0]
+    for k, v in config.items():
+        print_log("%s:\t%s\n" % (str(k), str(v)))
+    print_log("\n")
+    print_log(repr(model) + "\n\n")
+    print_log('total number of parameters: %d\n\n' % param_count)
+
+    return model, optim, print_log
+
+
+def batch_tokens(batch):
+    src, tgt = batch[0], batch[1]
+    return src.numel() + tgt.numel()
+
+
+def batch_bucket(batch):
+    # batches are sorted, so the padded source length is the longest source
+    return batch[0].size(1) // 32
+
+
+def split_batch(batch):
+    half = batch[0].size(0) // 2
+    pieces = []
+    for part in (slice(0, half), slice(half, None)):
+        src, tgt, label, lengths, tgt_len = [x[part] for x in batch]
+        pieces.append((src[:, :int(lengths.max())], tgt[:, :int(tgt_len.max())], label, lengths, tgt_len))
+    return pieces
+
+
+def split_to_limit(batch, max_tokens):
+    limit = max_tokens.get(batch_bucket(batch))
+    if limit is None or batch_tokens(batch) <= limit or batch[0].size(0) == 1:
+        return [batch]
+    return [piece for half in split_batch(batch) for piece in split_to_limit(half, max_tokens)]
+
+
+def train_batches(model, batches, norm, params):
+    """
+    Forward and backward over `batches`, whose gradients add up to those of
+    one update normalized by `norm`. A piece that runs out of memory is
+    retried as two halves, recursively. Half of the failed token count is
+    remembered as the limit of its source length bucket, and later batches
+    above the limit are split before they are tried.
+    """
+    pieces = [piece for batch in batches for piece in split_to_limit(batch, params['max_tokens'])]
+    loss, num_correct, num_total = 0, 0, 0
+
+    while len(pieces) > 0:
+        piece = pieces.pop(0)
+        src, tgt, label, lengths, tgt_len = piece
+        dec = tgt[:, :-1]
+        targets = tgt[:, 1:]
+
+        in_backward, oom = False, False
+        try:
+            with utils.autocast(config):
+                piece_loss, outputs = model(src, lengths, dec, targets, label, norm=norm)
+
+            if outputs is not None:
+                pred = outputs.max(2)[1]
+                targets = targets.t()
+                num_correct += pred.data.eq(targets.data).masked_select(targets.ne(utils.PAD).data).sum()
+                num_total += targets.ne(utils.PAD).data.sum()
+            else:
+                num_total += 1
+
+            in_backward = True
+            piece_loss.backward()
+            loss += float(piece_loss)
+
+        except RuntimeError as e:
+            if 'out of memory' not in str(e):
+                raise e
+            oom = True
+
+        if oom:
+            # handled outside of the except clause so that the traceback releases the graph
+            piece_loss = outputs = None
+            if hasattr(torch.cuda, 'empty_cache'):
+                torch.cuda.empty_cache()
+
+            params['oom_count'] += 1
+            bucket = batch_bucket(piece)
+            params['max_tokens'][bucket] = min(params['max_tokens'].get(bucket, float('inf')),
+                                               batch_tokens(piece) // 2)
+            if src.size(0) == 1:
+                print('| WARNING: ran out of memory on a single example, skipping the update')
+                model.zero_grad()
+                return None
+            if in_backward:
+                # part of this piece's gradients may already be accumulated
+                model.zero_grad()
+                return train_batches(model, batches, norm, params)
+            pieces = split_batch(piece) + pieces
+
+    return loss, num_correct, num_total
+
+
+def load_updates(trainloader, accum_steps):
+    """Groups the sorted batches of `trainloader` into lists of `accum_steps`, one list per update."""
+    batches = []
+    for src, tgt, label, src_len, tgt_len, original_src, original_tgt in trainloader:
+
+        src = Variable(src)
+        tgt = Variable(tgt)
+        label = Variable(label)
+        src_len = Variable(src_len)
+        tgt_len = Variable(tgt_len)
+        if config.use_cuda:
+            src = src.cuda()
+            tgt = tgt.cuda()
+            label = label.cuda()
+            src_len = src_len.cuda()
+            tgt_len = tgt_len.cuda()
+        lengths, indices = torch.sort(src_len, dim=0, descending=True)
+        src = torch.index_select(src, dim=0, index=indices)
+        tgt = torch.index_select(tgt, dim=0, index=indices)
+        label = torch.index_select(label, dim=0, index=indices)
+        tgt_len = torch.index_select(tgt_len, dim=0, index=indices)
+
+        batches.append((src, tgt, label, lengths, tgt_len))
+        if len(batches) == accum_steps:
+            yield batches
+            batches = []
+
+    if len(batches) > 0:
+        yield batches
+
+
+def train_model(model, datas, optim, epoch, params):
+
+    model.train()
+    trainloader = iter(datas['trainloader'])
+    if params['rng'] is not None:
+        # creating the iterator draws from the torch RNG, so a resumed run restores it afterwards
+        utils.set_rng_state(params['rng'])
+        params['rng'] = None
+
+    for batches in load_updates(trainloader, config.accum_steps):
+
+        model.zero_grad()
+
+        # every batch is normalized by the totals of the update, not by its own
+        norm = (sum(tgt[:, 1:].ne(utils.PAD).data.sum() for _, tgt, _, _, _ in batches),
+                sum(src.size(0) for src, _, _, _, _ in batches))
+
+        if utils.is_distributed():
+            norm = tuple(utils.all_reduce_sum(norm))
+        count_examples(params, norm[1])
+
+        stats = train_batches(model, batches, norm, params)
+        if utils.is_distributed():
+            # a rank that had to skip its batches still joins with zero gradients
+            utils.all_reduce_gradients(model.parameters(), sparse_params=optim.sparse_params)
+            optim.step()
+        elif stats is not None:
+            optim.step()
+
+        if stats is not None:
+            loss, num_correct, num_total = stats
+            params['report_loss'] += loss
+            params['report_correct'] += num_correct
+            params['report_total'] += num_total
+
+        if utils.get_rank() == 0:
+            utils.progress_bar(params['updates'], config.eval_interval)
+        params['updates'] += 1
+
+        if params['updates'] % config.eval_interval == 0 and utils.is_distributed():
+            params['report_loss'], params['report_correct'], params['report_total'], params['oom_count'] = \
+                utils.all_reduce_sum([params['report_loss'], params['report_correct'],
+                                      params['report_total'], params['oom_count']])
+
+        score = None
+        if params['updates'] % config.eval_interval == 0 and utils.get_rank() == 0:
+            params['log']("epoch: %3d, loss: %6.3f, time: %6.3f, updates: %8d, accuracy: %2.2f\n"
+                          % (epoch, params['report_loss'], time.time()-params['report_time'],
+                             params['updates'], params['report_correct'] * 100.0 / params['report_total']))
+            if params['oom_count'] > 0:
+                params['log']("ran out of memory %d times, token limits per length bucket: %s\n"
+                              % (params['oom_count'], str(sorted(params['max_tokens'].items()))))
+            print('evaluating after %d updates...\r' % params['updates'])
+            score = eval_model(model, datas, params)
+            report_throughput(params, score)
+            model.train()
+
+        # reset before saving, a run resumed from the checkpoint must not report this interval again
+        if params['updates'] % config.eval_interval == 0:
+            params['report_loss'], params['report_time'] = 0, time.time()
+            params['report_correct'], params['report_total'] = 0, 0
+            params['oom_count'] = 0
+            params['report_examples'] = examples_seen(params)
+
+        if params['updates'] % config.eval_interval == 0 or params['updates'] % config.save_interval == 0:
+            # every process resumes from its own RNG state, taken after the evaluation
+            rng = utils.all_gather_object(utils.get_rng_state())
+
+        if isinstance(score, dict):
+            for metric in config.metrics:
+                params[metric].append(score[metric])
+                if score[metric] >= max(params[metric]):
+                    save_model(params['log_path']+'best_'+metric+'_checkpoint.pt', model, optim, params, rng)
+
+        if params['updates'] % config.save_interval == 0 and utils.get_rank() == 0:
+            save_model(params['log_path']+'checkpoint_%d.pt' % params['updates'], model, optim, params, rng,
+                       rotate=True)
+
+    optim.updateLearningRate(score=0, epoch=epoch)
+
+
+def examples_seen(params):
+    counter = params['examples_seen']
+    # hogwild workers share one counter
+    return counter.value if hasattr(counter, 'value') else counter
+
+
+def count_examples(params, num_examples):
+    if hasattr(params['examples_seen'], 'value'):
+        with params['examples_seen'].get_lock():
+            params['examples_seen'].value += int(num_examples)
+    else:
+        params['examples_seen'] += int(num_examples)
+
+
+def report_throughput(params, score):
+    """Appends training speed and validation scores to throughput.csv to compare training modes."""
+    path = params['log_path'] + 'throughput.csv'
+    metrics = list(config.metrics)
+    if not os.path.exists(path):
+        with open(path, 'w') as f:
+            f.write(','.join(['mode', 'processes', 'updates', 'seconds', 'examples',
+                              'examples_per_second', 'loss'] + metrics) + '\n')
+    mode = 'hogwild' if opt.hogwild else 'distributed' if opt.distributed else 'single'
+    processes = opt.num_processes * opt.num_nodes if opt.distributed else utils.get_world_size()
+    examples = examples_seen(params)
+    speed = (examples - params['report_examples']) / (time.time() - params['report_time'])
+    scores = [score[metric] if isinstance(score, dict) else 0 for metric in metrics]
+    with open(path, 'a') as f:
+        f.write(','.join(map(str, [mode, processes, params['updates'], round(time.time() - params['start_time'], 1),
+                                   examples, round(speed, 2), round(float(params['report_loss']), 4)] + scores)) + '\n')
+
+
+def eval_model(model, datas, params):
+
+    model.eval()
+    reference, candidate, source, alignments = [], [], [], []
+    correct_2, correct_5 = 0, 0
+    count, total_count = 0, len(datas['validset'])
+    validloader = datas['validloader']
+    tgt_vocab = datas['tgt_vocab']
+
+    for src, tgt, label, src_len, tgt_len, reverse_indices, original_src, original_tgt in validloader:
+
+        src = Variable(src, volatile=True)
+        src_len = Variable(src_len, volatile=True)
+        label = Variable(label, volatile=True)
+        reverse_indices = Variable(reverse_indices, volatile=True)
+        if config.use_cuda:
+            src = src.cuda()
+            src_len = src_len.cuda()
+            label = label.cuda()
+            reverse_indices = reverse_indices.cuda()
+
+        with utils.autocast(config):
+            if config.beam_size > 1:
+                samples, alignment, c_5, c_2 = model.beam_sample(src, src_len, label, beam_size=config.beam_size,
+                                                                 reverse_indices=reverse_indices)
+            else:
+                samples, alignment, c_5, c_2 = model.sample(src, src_len, label, reverse_indices=reverse_indices)
+
+        if samples is not None:
+            candidate += [tgt_vocab.convertToLabels(s, utils.EOS) for s in samples]
+            source += original_src
+            reference += original_tgt
+
+        if alignment is not None:
+            alignments += [align for align in alignment]
+
+        count += len(original_src)
+        correct_2 += c_2
+        correct_5 += c_5
+        utils.progress_bar(count, total_count)
+
+    if config.unk and config.attention != 'None' and len(candidate) > 0:
+        candidate = utils.replace_unk(source, candidate, alignments)
+
+    accuracy_five = correct_5 * 100.0 / total_count
+    accuracy_two = correct_2 * 100.0 / total_count
+    print("acc = %.2f, %.2f" % (accuracy_five, accuracy_two))
+
+    if len(candidate) > 0:
+        score = {}
+        for metric in config.metrics:
+            try:
+                score[metric] = getattr(utils, metric)(reference, candidate, params['log_path'], params['log'], config)
+            except:
+                score[metric] = 0
+        return score
+    else:
+        return 0
+
+
+def save_model(path, model, optim, params, rng, rotate=False):
+    """`rng` holds the RNG states of all processes, in rank order."""
+    model_state_dict = model.state_dict()
+    checkpoints = {
+        'model': model_state_dict,
+        'config': dict(config),
+        'optim': optim.state_dict(),
+        'updates': params['updates'],
+        'epoch': params['epoch'],
+        'sampler': params['sampler'].state_dict(),
+        'rng': rng,
+        'report': {'loss': float(params['report_loss']),
+                   'correct': float(params['report_correct']),
+                   'total': float(params['report_total']),
+                   'elapsed': time.time() - params['report_time'],
+                   'metrics': {metric: params[metric] for metric in config.metrics}}}
+    params['saver'].save(path, checkpoints, rotate=rotate)
+
+
+def build_log():
+    # log
+    if opt.log == '':
+        log_path = config.logF + str(int(time.time() * 1000)) + '/'
+    else:
+        log_path = config.logF + opt.log + '/'
+    if utils.get_rank() != 0:
+        # only the first process writes logs and checkpoints
+        return lambda s: None, log_path
+    if not os.path.exists(config.logF):
+        os.mkdir(config.logF)
+    if not os.path.exists(log_path):
+        os.mkdir(log_path)
+    print_log = utils.print_log(log_path + 'log.txt')
+    return print_log, log_path
+
+
+def build_params(datas, print_log, log_path, examples_seen=0):
+    params = {'updates': 0, 'report_loss': 0, 'report_total': 0,
+              'report_correct': 0, 'report_time': time.time(),
+              'log': print_log, 'log_path': log_path,
+              'epoch': 1, 'sampler': datas['sampler'],
+              'oom_count': 0, 'max_tokens': {}, 'rng': None,
+              'start_time': time.time(), 'examples_seen': examples_seen, 'report_examples': 0,
+              'saver': utils.CheckpointSaver(keep=opt.keep_checkpoints, pattern=log_path+'checkpoint_*.pt')}
+    for metric in config.metrics:
+        params[metric] = []
+    return params
+
+
+def resume(checkpoints, datas, params):
+    """Continues the update count, data order, RNG and report of a run from its checkpoint."""
+    params['updates'] = checkpoints['updates']
+    if 'sampler' in checkpoints:
+        # continue from the batch following the checkpoint
+        params['epoch'] = checkpoints['epoch']
+        datas['sampler'].load_state_dict(checkpoints['sampler'])
+        # older checkpoints only kept the RNG state of the first process
+        rng = checkpoints['rng'] if isinstance(checkpoints['rng'], list) else [checkpoints['rng']]
+        if utils.get_rank() < len(rng):
+            # set by train_model once the batch iterator exists
+            params['rng'] = rng[utils.get_rank()]
+    if 'sampler' in checkpoints and utils.get_rank() == 0:
+        # report accumulators are those of the first process
+        report = checkpoints['report']
+        params['report_loss'], params['report_time'] = report['loss'], time.time() - report['elapsed']
+        params['report_correct'], params['report_total'] = report['correct'], report['total']
+        for metric in config.metrics:
+            params[metric] = report['metrics'].get(metric, [])
+
+
+def train(model, datas, optim, params):
+    for i in range(params['epoch'], config.epoch + 1):
+        params['epoch'] = i
+        datas['sampler'].set_epoch(i)
+        train_model(model, datas, optim, i, params)
+    for metric in config.metrics:
+        if len(params[metric]) > 0:
+            params['log']("Best %s score: %.2f\n" % (metric, max(params[metric])))
+
+
+def main(shared_model=None, examples_seen=0):
+    # checkpoint
+    if opt.restore:
+        print('loading checkpoint...\n')
+        checkpoints = torch.load(opt.restore)
+    else:
+        checkpoints = None
+
+    datas = load_data()
+    print_log, log_path = build_log()
+    model, optim, print_log = build_model(checkpoints, print_log, model=shared_model)
+    if utils.is_distributed():
+        utils.broadcast_parameters(model)
+
+    params = build_params(datas, print_log, log_path, examples_seen)
+    if opt.restore:
+        resume(checkpoints, datas, params)
+
+    if opt.mode == 'train':
+        train(model, datas, optim, params)
+    elif utils.get_rank() == 0:
+        score = eval_model(model, datas, params)
+
+    params['saver'].close()
+
+
+def main_worker(local_rank):
+    rank = opt.node_rank * opt.num_processes + local_rank
+    world_size = opt.num_nodes * opt.num_processes
+    # the cores of a host are shared among its processes
+    torch.set_num_threads(max(1, multiprocessing.cpu_count() // opt.num_processes))
+    torch.manual_seed(opt.seed + rank)
+    utils.init_distributed(opt.dist_url, world_size, rank, timeout=opt.dist_timeout)
+    main()
+
+
+def hogwild_worker(local_rank, shared_model, examples_seen):
+    utils.set_worker(local_rank, opt.num_processes)
+    torch.set_num_threads(max(1, multiprocessing.cpu_count() // opt.num_processes))
+    torch.manual_seed(opt.seed + local_rank)
+    main(shared_model, examples_seen)
+
+
+def main_hogwild():
+    """
+    Lock-free asynchronous training: the workers update one model in shared
+    memory, each over its own shard and with its own optimizer state.
+    """
+    checkpoints = torch.load(opt.restore) if opt.restore else None
+    # the shared model only needs the vocabulary sizes, the workers load the data
+    datas = pickle.load(open(config.data+'data.pkl', 'rb'))
+    config.src_vocab_size = datas['dict']['src'].size()
+    config.tgt_vocab_size = datas['dict']['tgt'].size()
+    model = create_model(checkpoints)
+    model.share_memory()
+    examples_seen = torch.multiprocessing.get_context('spawn').Value('l', 0)
+    torch.multiprocessing.spawn(hogwild_worker, args=(model, examples_seen), nprocs=opt.num_processes)
+
+
+if __name__ == '__main__':
+    if opt.distributed:
+        torch.multiprocessing.spawn(main_worker, nprocs=opt.num_processes)
+    elif opt.hogwild:
+        main_hogwild()
+    else:
+        main()
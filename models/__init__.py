@@ -1,18 +1,33 @@
-'''
- @Date  : 2017/12/18
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
-'''
-from .attention import *
-from .loss import *
-from .optims import *
-from .rnn import *
-from .seq2seq import *
-from .beam import *
-from .splitres import *
-from .split import *
-from .s2sae import *
-from .regression import *
-from .label import *
-from .classifier import *
\ No newline at end of file
+'''
+ @Date  : 2017/12/18
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
+'''
+import importlib
+import os
+
+from utils.misc_utils import defined_names
+
+# public names of every submodule, read from their sources; a submodule is
+# only imported once one of its names is used, so that e.g. serving the label
+# model does not load the other model families
+directory = os.path.dirname(os.path.abspath(__file__))
+registry = {f[:-3]: defined_names(os.path.join(directory, f))
+            for f in sorted(os.listdir(directory)) if f.endswith('.py') and f != '__init__.py'}
+lazy_names = {name: module for module, names in registry.items() for name in names}
+
+
+def __getattr__(name):
+    if name not in lazy_names:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    module = lazy_names[name]
+    submodule = importlib.import_module('.' + module, __name__)
+    # set after the import, which binds the submodule itself to its name
+    for n in registry[module]:
+        globals()[n] = getattr(submodule, n)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_names))
@@ -1,189 +1,193 @@
-'''
- @Date  : 2017/12/18
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
-'''
-import torch
-import torch.nn as nn
-from torch.autograd import Variable
-
-
-class empty_attention(nn.Module):
-
-    def __init__(self, hidden_size, emb_size, pool_size=0):
-        super(empty_attention, self).__init__()
-        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
-
-    def init_context(self, context):
-        self.context = context.transpose(0, 1)
-
-    def forward(self, h, x):
-        output = h
-        weights = Variable(torch.zeros(self.context.size(0), self.context.size(1)), requires_grad=False)
-
-        return output, weights
-
-
-class label_attention(nn.Module):
-
-    def __init__(self, hidden_size, emb_size, pool_size=0):
-        super(label_attention, self).__init__()
-        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
-        self.linear_in = nn.Linear(hidden_size, hidden_size)
-        if pool_size > 0:
-            self.linear_out = maxout(2*hidden_size + emb_size, hidden_size, pool_size)
-        else:
-            self.linear_out = nn.Sequential(nn.Linear(2*hidden_size + emb_size, hidden_size), nn.Tanh())
-        self.softmax = nn.Softmax(dim=1)
-
-    def init_context(self, context):
-        self.context = context.transpose(0, 1)
-
-    def forward(self, h, x):
-        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
-        weights = torch.bmm(self.context, gamma_h).squeeze(2)   # batch * time
-        weights = self.softmax(weights)   # batch * time
-        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
-        output = self.linear_out(torch.cat([c_t, h, x], 1))
-
-        return output, weights
-
-
-class sigmoid_attention(nn.Module):
-
-    def __init__(self, hidden_size, emb_size, pool_size=0):
-        super(sigmoid_attention, self).__init__()
-        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
-        self.linear_in = nn.Linear(hidden_size, hidden_size)
-        if pool_size > 0:
-            self.linear_out = maxout(2*hidden_size + emb_size, hidden_size, pool_size)
-        else:
-            self.linear_out = nn.Sequential(nn.Linear(2*hidden_size + emb_size, hidden_size), nn.Tanh())
-        self.sigmoid = nn.Sigmoid()
-
-    def init_context(self, context):
-        self.context = context.transpose(0, 1)
-
-    def forward(self, h, x):
-        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
-        weights = torch.bmm(self.context, gamma_h).squeeze(2)   # batch * time
-        weights = self.sigmoid(weights)   # batch * time
-        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
-        output = self.linear_out(torch.cat([c_t, h, x], 1))
-
-        return output, weights
-
-
-class luong_attention(nn.Module):
-
-    def __init__(self, hidden_size, emb_size, pool_size=0):
-        super(luong_attention, self).__init__()
-        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
-        self.linear_in = nn.Linear(hidden_size, hidden_size)
-        if pool_size > 0:
-            self.linear_out = maxout(2*hidden_size + emb_size, hidden_size, pool_size)
-        else:
-            self.linear_out = nn.Sequential(nn.Linear(2*hidden_size + emb_size, hidden_size), nn.Tanh())
-        self.softmax = nn.Softmax(dim=1)
-
-    def init_context(self, context):
-        self.context = context.transpose(0, 1)
-
-    def forward(self, h, x):
-        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
-        weights = torch.bmm(self.context, gamma_h).squeeze(2)   # batch * time
-        weights = self.softmax(weights)   # batch * time
-        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
-        output = self.linear_out(torch.cat([c_t, h, x], 1))
-
-        return output, weights
-
-
-class decoder_attention(nn.Module):
-
-    def __init__(self, hidden_size, emb_size, pool_size=0):
-        super(decoder_attention, self).__init__()
-        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
-        self.linear_in = nn.Linear(hidden_size, hidden_size)
-        if pool_size > 0:
-            self.linear_out = maxout(2*hidden_size + emb_size, hidden_size, pool_size)
-        else:
-            self.linear_out = nn.Sequential(nn.Linear(2*hidden_size + emb_size, hidden_size), nn.Tanh())
-        self.softmax = nn.Softmax(dim=1)
-
-    def init_context(self, context):
-        self.context = context.transpose(0, 1)
-        self.decoder_context = None
-
-    def add_context(self, hidden):
-        if self.decoder_context is None:
-            self.decoder_context = hidden.unsqueeze(1)
-        else:
-            self.decoder_context = torch.cat([self.decoder_context, hidden.unsqueeze(1)], dim=1)
-
-    def remove_context(self):
-        self.decoder_context = None
-
-    def forward(self, h, x):
-        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
-        weights = torch.bmm(self.context, gamma_h).squeeze(2)   # batch * time
-        weights = self.softmax(weights)   # batch * time
-        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
-
-        output = self.linear_out(torch.cat([c_t, h, x], 1))
-
-        if self.decoder_context is not None:
-            dec_weights = torch.bmm(self.decoder_context, output.unsqueeze(2)).squeeze(2)
-            dec_weights = self.softmax(dec_weights)
-            d_t = torch.bmm(dec_weights.unsqueeze(1), self.decoder_context).squeeze(1)
-            output -= Variable(d_t.data, requires_grad=False)
-
-        self.add_context(output)
-
-        return output, weights
-
-
-class bahdanau_attention(nn.Module):
-
-    def __init__(self, hidden_size, emb_size, pool_size=0):
-        super(bahdanau_attention, self).__init__()
-        self.linear_encoder = nn.Linear(hidden_size, hidden_size)
-        self.linear_decoder = nn.Linear(hidden_size, hidden_size)
-        self.linear_v = nn.Linear(hidden_size, 1)
-        self.linear_r = nn.Linear(hidden_size*2+emb_size, hidden_size*2)
-        self.hidden_size = hidden_size
-        self.emb_size = emb_size
-        self.softmax = nn.Softmax(dim=1)
-        self.tanh = nn.Tanh()
-
-    def init_context(self, context):
-        self.context = context.transpose(0, 1)
-
-    def forward(self, h, x):
-        gamma_encoder = self.linear_encoder(self.context)           # batch * time * size
-        gamma_decoder = self.linear_decoder(h).unsqueeze(1)    # batch * 1 * size
-        weights = self.linear_v(self.tanh(gamma_encoder+gamma_decoder)).squeeze(2)   # batch * time
-        weights = self.softmax(weights)   # batch * time
-        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
-        r_t = self.linear_r(torch.cat([c_t, h, x], dim=1))
-        output = r_t.view(-1, self.hidden_size, 2).max(2)[0]
-
-        return output, weights
-
-
-class maxout(nn.Module):
-
-    def __init__(self, in_feature, out_feature, pool_size):
-        super(maxout, self).__init__()
-        self.in_feature = in_feature
-        self.out_feature = out_feature
-        self.pool_size = pool_size
-        self.linear = nn.Linear(in_feature, out_feature*pool_size)
-
-    def forward(self, x):
-        output = self.linear(x)
-        output = output.view(-1, self.out_feature, self.pool_size)
-        output = output.max(2)[0]
-
-        return output
+'''
+ @Date  : 2017/12/18
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
+'''
+import torch
+import torch.nn as nn
+from torch.autograd import Variable
+
+
+class empty_attention(nn.Module):
+
+    def __init__(self, hidden_size, emb_size, pool_size=0):
+        super(empty_attention, self).__init__()
+        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
+
+    def init_context(self, context):
+        self.context = context.transpose(0, 1)
+
+    def forward(self, h, x):
+        output = h
+        weights = Variable(torch.zeros(self.context.size(0), self.context.size(1)), requires_grad=False)
+
+        return output, weights
+
+
+class label_attention(nn.Module):
+
+    def __init__(self, hidden_size, emb_size, pool_size=0):
+        super(label_attention, self).__init__()
+        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
+        self.linear_in = nn.Linear(hidden_size, hidden_size)
+        if pool_size > 0:
+            self.linear_out = maxout(2*hidden_size + emb_size, hidden_size, pool_size)
+        else:
+            self.linear_out = nn.Sequential(nn.Linear(2*hidden_size + emb_size, hidden_size), nn.Tanh())
+        self.softmax = nn.Softmax(dim=1)
+
+    def init_context(self, context, mask=None):
+        """`mask` (batch * time) marks the padding of contexts of different lengths."""
+        self.context = context.transpose(0, 1)
+        self.mask = mask
+
+    def forward(self, h, x):
+        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
+        weights = torch.bmm(self.context, gamma_h).squeeze(2)   # batch * time
+        if self.mask is not None:
+            weights = weights.masked_fill(self.mask, -float('inf'))
+        weights = self.softmax(weights)   # batch * time
+        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
+        output = self.linear_out(torch.cat([c_t, h, x], 1))
+
+        return output, weights
+
+
+class sigmoid_attention(nn.Module):
+
+    def __init__(self, hidden_size, emb_size, pool_size=0):
+        super(sigmoid_attention, self).__init__()
+        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
+        self.linear_in = nn.Linear(hidden_size, hidden_size)
+        if pool_size > 0:
+            self.linear_out = maxout(2*hidden_size + emb_size, hidden_size, pool_size)
+        else:
+            self.linear_out = nn.Sequential(nn.Linear(2*hidden_size + emb_size, hidden_size), nn.Tanh())
+        self.sigmoid = nn.Sigmoid()
+
+    def init_context(self, context):
+        self.context = context.transpose(0, 1)
+
+    def forward(self, h, x):
+        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
+        weights = torch.bmm(self.context, gamma_h).squeeze(2)   # batch * time
+        weights = self.sigmoid(weights)   # batch * time
+        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
+        output = self.linear_out(torch.cat([c_t, h, x], 1))
+
+        return output, weights
+
+
+class luong_attention(nn.Module):
+
+    def __init__(self, hidden_size, emb_size, pool_size=0):
+        super(luong_attention, self).__init__()
+        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
+        self.linear_in = nn.Linear(hidden_size, hidden_size)
+        if pool_size > 0:
+            self.linear_out = maxout(2*hidden_size + emb_size, hidden_size, pool_size)
+        else:
+            self.linear_out = nn.Sequential(nn.Linear(2*hidden_size + emb_size, hidden_size), nn.Tanh())
+        self.softmax = nn.Softmax(dim=1)
+
+    def init_context(self, context):
+        self.context = context.transpose(0, 1)
+
+    def forward(self, h, x):
+        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
+        weights = torch.bmm(self.context, gamma_h).squeeze(2)   # batch * time
+        weights = self.softmax(weights)   # batch * time
+        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
+        output = self.linear_out(torch.cat([c_t, h, x], 1))
+
+        return output, weights
+
+
+class decoder_attention(nn.Module):
+
+    def __init__(self, hidden_size, emb_size, pool_size=0):
+        super(decoder_attention, self).__init__()
+        self.hidden_size, self.emb_size, self.pool_size = hidden_size, emb_size, pool_size
+        self.linear_in = nn.Linear(hidden_size, hidden_size)
+        if pool_size > 0:
+            self.linear_out = maxout(2*hidden_size + emb_size, hidden_size, pool_size)
+        else:
+            self.linear_out = nn.Sequential(nn.Linear(2*hidden_size + emb_size, hidden_size), nn.Tanh())
+        self.softmax = nn.Softmax(dim=1)
+
+    def init_context(self, context):
+        self.context = context.transpose(0, 1)
+        self.decoder_context = None
+
+    def add_context(self, hidden):
+        if self.decoder_context is None:
+            self.decoder_context = hidden.unsqueeze(1)
+        else:
+            self.decoder_context = torch.cat([self.decoder_context, hidden.unsqueeze(1)], dim=1)
+
+    def remove_context(self):
+        self.decoder_context = None
+
+    def forward(self, h, x):
+        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
+        weights = torch.bmm(self.context, gamma_h).squeeze(2)   # batch * time
+        weights = self.softmax(weights)   # batch * time
+        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
+
+        output = self.linear_out(torch.cat([c_t, h, x], 1))
+
+        if self.decoder_context is not None:
+            dec_weights = torch.bmm(self.decoder_context, output.unsqueeze(2)).squeeze(2)
+            dec_weights = self.softmax(dec_weights)
+            d_t = torch.bmm(dec_weights.unsqueeze(1), self.decoder_context).squeeze(1)
+            output -= Variable(d_t.data, requires_grad=False)
+
+        self.add_context(output)
+
+        return output, weights
+
+
+class bahdanau_attention(nn.Module):
+
+    def __init__(self, hidden_size, emb_size, pool_size=0):
+        super(bahdanau_attention, self).__init__()
+        self.linear_encoder = nn.Linear(hidden_size, hidden_size)
+        self.linear_decoder = nn.Linear(hidden_size, hidden_size)
+        self.linear_v = nn.Linear(hidden_size, 1)
+        self.linear_r = nn.Linear(hidden_size*2+emb_size, hidden_size*2)
+        self.hidden_size = hidden_size
+        self.emb_size = emb_size
+        self.softmax = nn.Softmax(dim=1)
+        self.tanh = nn.Tanh()
+
+    def init_context(self, context):
+        self.context = context.transpose(0, 1)
+
+    def forward(self, h, x):
+        gamma_encoder = self.linear_encoder(self.context)           # batch * time * size
+        gamma_decoder = self.linear_decoder(h).unsqueeze(1)    # batch * 1 * size
+        weights = self.linear_v(self.tanh(gamma_encoder+gamma_decoder)).squeeze(2)   # batch * time
+        weights = self.softmax(weights)   # batch * time
+        c_t = torch.bmm(weights.unsqueeze(1), self.context).squeeze(1) # batch * size
+        r_t = self.linear_r(torch.cat([c_t, h, x], dim=1))
+        output = r_t.view(-1, self.hidden_size, 2).max(2)[0]
+
+        return output, weights
+
+
+class maxout(nn.Module):
+
+    def __init__(self, in_feature, out_feature, pool_size):
+        super(maxout, self).__init__()
+        self.in_feature = in_feature
+        self.out_feature = out_feature
+        self.pool_size = pool_size
+        self.linear = nn.Linear(in_feature, out_feature*pool_size)
+
+    def forward(self, x):
+        output = self.linear(x)
+        output = output.view(-1, self.out_feature, self.pool_size)
+        output = output.max(2)[0]
+
+        return output
@@ -1,210 +1,346 @@
-'''
- @Date  : 2018/1/23
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
-'''
-
-import torch
-import torch.nn as nn
-from torch.autograd import Variable
-import utils
-import models
-
-
-class label(nn.Module):
-
-    def __init__(self, config, use_attention=True, encoder=None, decoder=None):
-        super(label, self).__init__()
-
-        if encoder is not None:
-            self.encoder = encoder
-        else:
-            self.encoder = models.rnn_encoder(config)
-        tgt_embedding = self.encoder.embedding if config.shared_vocab else None
-        if decoder is not None:
-            self.decoder = decoder
-        else:
-            self.decoder = models.label_rnn_decoder(config, embedding=tgt_embedding, use_attention=use_attention)
-        self.log_softmax = nn.LogSoftmax(dim=-1)
-        self.use_cuda = config.use_cuda
-        self.config = config
-        self.criterion = nn.CrossEntropyLoss(ignore_index=utils.PAD, size_average=False)
-
-        self._classifier = nn.Sequential(nn.Linear(config.hidden_size, config.hidden_size*2),
-                                         nn.ReLU(),
-                                         nn.Dropout(p=0.2),
-                                         nn.Linear(config.hidden_size*2, config.num_label))
-
-        self.label_criterion = nn.CrossEntropyLoss(size_average=True)
-
-    def compute_loss(self, scores, targets):
-        scores = scores.view(-1, scores.size(2))
-        loss = self.criterion(scores, targets.contiguous().view(-1))
-        num_total = targets.ne(utils.PAD).data.sum()
-        return loss / num_total
-
-    def compute_label_loss(self, scores, targets):
-        loss = self.label_criterion(scores, targets)
-        return loss
-
-    def classify(self, state):
-        scores = self._classifier(state.max(0)[0])
-        return scores
-
-    def forward(self, src, src_len, dec, targets, label):
-        src = src.t()
-        dec = dec.t()
-        targets = targets.t()
-
-        contexts, state = self.encoder(src, src_len.data.tolist())
-
-        self.decoder.semantic_attention.init_context(context=contexts)
-        self.decoder.sentiment_attention.init_context(context=contexts)
-
-        outputs, hiddens = [], []
-        for input in dec.split(1):
-            semantic_output, sentiment_output, state, attn_weights = self.decoder(input.squeeze(0), state)
-            outputs.append(semantic_output)
-            hiddens.append(sentiment_output)
-
-        outputs = torch.stack(outputs)
-        hiddens = torch.stack(hiddens)
-
-        #print(hiddens.size())
-        label_scores = self.classify(torch.cat([contexts, hiddens], dim=0))
-        #print(label_scores.size())
-
-        loss = self.compute_loss(outputs, targets) + self.compute_label_loss(label_scores, label)
-        return loss, outputs
-
-    def sample(self, src, src_len, label):
-
-        lengths, indices = torch.sort(src_len, dim=0, descending=True)
-        _, reverse_indices = torch.sort(indices)
-        src = torch.index_select(src, dim=0, index=indices)
-        label = torch.index_select(label, dim=0, index=indices)
-        bos = Variable(torch.ones(src.size(0)).long().fill_(utils.BOS), volatile=True)
-        src = src.t()
-
-        if self.use_cuda:
-            bos = bos.cuda()
-
-        contexts, state = self.encoder(src, lengths.data.tolist())
-
-        self.decoder.semantic_attention.init_context(context=contexts)
-        self.decoder.sentiment_attention.init_context(context=contexts)
-
-        inputs, outputs, attn_matrix, hiddens = [bos], [], [], []
-        for i in range(self.config.max_time_step):
-            semantic_output, sentiment_output, state, attn_weights = self.decoder(inputs[i], state)
-            predicted = semantic_output.max(1)[1]
-            #predicted = torch.multinomial(torch.nn.functional.softmax(output/0.6), num_samples=1).squeeze(1)
-            inputs += [predicted]
-            outputs += [predicted]
-            attn_matrix += [attn_weights]
-            hiddens += [sentiment_output]
-
-        outputs = torch.stack(outputs)
-        hiddens = torch.stack(hiddens)
-        predicts = self.classify(torch.cat([contexts, hiddens], dim=0)).max(1)[1]
-        sample_ids = torch.index_select(outputs, dim=1, index=reverse_indices).t().data
-
-        attn_matrix = torch.stack(attn_matrix)
-        alignments = attn_matrix.max(2)[1]
-        alignments = torch.index_select(alignments, dim=1, index=reverse_indices).t().data
-
-        correct_five = torch.sum(torch.eq(predicts.data, label.data).float())
-        correct_two = torch.sum(torch.eq(torch.ge(predicts.data, 3), torch.ge(label.data, 3)).float())
-
-        return sample_ids, alignments, correct_five, correct_two
-
-
-    def beam_sample(self, src, src_len, label, beam_size):
-
-        # (1) Run the encoder on the src.
-
-        lengths, indices = torch.sort(src_len, dim=0, descending=True)
-        _, ind = torch.sort(indices)
-        src = torch.index_select(src, dim=0, index=indices)
-        label = torch.index_select(label, dim=0, index=indices)
-        src = src.t()
-        batch_size = src.size(1)
-        contexts, encState = self.encoder(src, lengths.data.tolist())
-        vector, contexts = torch.chunk(contexts, chunks=2, dim=-1)
-        predicts = self.classify(vector).max(1)[1]
-
-        correct_five = torch.sum(torch.eq(predicts.data, label.data).float())
-        correct_two = torch.sum(torch.eq(torch.ge(predicts.data, 3), torch.ge(label.data, 3)).float())
-
-        #  (1b) Initialize for the decoder.
-        def var(a):
-            return Variable(a, volatile=True)
-
-        def rvar(a):
-            return var(a.repeat(1, beam_size, 1))
-
-        def bottle(m):
-            return m.view(batch_size * beam_size, -1)
-
-        def unbottle(m):
-            return m.view(beam_size, batch_size, -1)
-
-        # Repeat everything beam_size times.
-        contexts = rvar(contexts.data)
-
-        if self.config.cell == 'lstm':
-            decState = (rvar(encState[0].data), rvar(encState[1].data))
-        else:
-            decState = rvar(encState.data)
-        #decState.repeat_beam_size_times(beam_size)
-        beam = [models.Beam(beam_size, n_best=1,
-                          cuda=self.use_cuda, length_norm=self.config.length_norm)
-                for __ in range(batch_size)]
-        if self.decoder.attention is not None:
-            self.decoder.attention.init_context(contexts)
-
-        # (2) run the decoder to generate sentences, using beam search.
-
-        for i in range(self.config.max_time_step):
-
-            if all((b.done() for b in beam)):
-                break
-
-            # Construct batch x beam_size nxt words.
-            # Get all the pending current beam words and arrange for forward.
-            inp = var(torch.stack([b.getCurrentState() for b in beam])
-                      .t().contiguous().view(-1))
-
-            # Run one step.
-            output, decState, attn = self.decoder(inp, decState)
-            # decOut: beam x rnn_size
-
-            # (b) Compute a vector of batch*beam word scores.
-            output = unbottle(self.log_softmax(output))
-            attn = unbottle(attn)
-                # beam x tgt_vocab
-
-            # (c) Advance each beam.
-            # update state
-            for j, b in enumerate(beam):
-                b.advance(output.data[:, j], attn.data[:, j])
-                b.beam_update(decState, j)
-
-        # (3) Package everything up.
-        allHyps, allScores, allAttn = [], [], []
-
-        for j in ind.data:
-            b = beam[j]
-            n_best = 1
-            scores, ks = b.sortFinished(minimum=n_best)
-            hyps, attn = [], []
-            for i, (times, k) in enumerate(ks[:n_best]):
-                hyp, att = b.getHyp(times, k)
-                hyps.append(hyp)
-                attn.append(att.max(1)[1])
-            allHyps.append(hyps[0])
-            allScores.append(scores[0])
-            allAttn.append(attn[0])
-
-        return allHyps, allAttn, correct_five, correct_two
\ No newline at end of file
+'''
+ @Date  : 2018/1/23
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
+'''
+
+import torch
+import torch.nn as nn
+from torch.autograd import Variable
+from torch.utils.checkpoint import checkpoint
+import utils
+import models
+
+
+class label(nn.Module):
+
+    def __init__(self, config, use_attention=True, encoder=None, decoder=None):
+        super(label, self).__init__()
+
+        if encoder is not None:
+            self.encoder = encoder
+        else:
+            self.encoder = models.rnn_encoder(config)
+        tgt_embedding = self.encoder.embedding if config.shared_vocab else None
+        if decoder is not None:
+            self.decoder = decoder
+        else:
+            self.decoder = models.label_rnn_decoder(config, embedding=tgt_embedding, use_attention=use_attention)
+        self.log_softmax = nn.LogSoftmax(dim=-1)
+        self.use_cuda = config.use_cuda
+        self.config = config
+        self.criterion = nn.CrossEntropyLoss(ignore_index=utils.PAD, size_average=False)
+
+        self._classifier = nn.Sequential(nn.Linear(config.hidden_size, config.hidden_size*2),
+                                         nn.ReLU(),
+                                         nn.Dropout(p=0.2),
+                                         nn.Linear(config.hidden_size*2, config.num_label))
+
+        self.label_criterion = nn.CrossEntropyLoss(size_average=True)
+
+    def compute_loss(self, scores, targets, num_total=None):
+        # losses are computed in float32 under bf16 autocast
+        scores = scores.float().view(-1, scores.size(2))
+        loss = self.criterion(scores, targets.contiguous().view(-1))
+        if num_total is None:
+            num_total = targets.ne(utils.PAD).data.sum()
+        return loss / num_total
+
+    def compute_label_loss(self, scores, targets, num_total=None):
+        loss = self.label_criterion(scores.float(), targets)
+        if num_total is not None:
+            loss = loss * scores.size(0) / num_total
+        return loss
+
+    def classify(self, state):
+        scores = self._classifier(state.max(0)[0])
+        return scores
+
+    def forward(self, src, src_len, dec, targets, label, norm=None):
+        """
+        `norm` is the (target tokens, examples) count of the whole update when
+        this batch is only a part of it, so that the losses of all parts add
+        up to the loss of the full batch. Source and target padding is masked
+        out of the attention and the max-pool, so that the loss of a row does
+        not depend on how far the other rows of its batch are padded.
+        """
+        num_tokens, num_examples = norm if norm is not None else (None, None)
+        src = src.t()
+        dec = dec.t()
+        targets = targets.t()
+
+        # gradient checkpointing: activations are recomputed during backward
+        if self.training and self.config.checkpoint_encoder:
+            contexts, state = checkpoint(self.encoder, src, src_len.data.tolist(), use_reentrant=False)
+        else:
+            contexts, state = self.encoder(src, src_len.data.tolist())
+        mask = torch.arange(contexts.size(0), device=src_len.device).unsqueeze(0) >= src_len.unsqueeze(1)
+
+        segment = self.config.checkpoint_segment if self.training else 0
+        if segment > 0:
+            outputs, hiddens = [], []
+            for inputs in dec.split(segment):
+                block_outputs, block_hiddens, state = checkpoint(self.decode_steps, contexts, state, inputs, mask,
+                                                                 use_reentrant=False)
+                outputs.append(block_outputs)
+                hiddens.append(block_hiddens)
+            outputs = torch.cat(outputs)
+            hiddens = torch.cat(hiddens)
+        else:
+            outputs, hiddens, state = self.decode_steps(contexts, state, dec, mask)
+
+        #print(hiddens.size())
+        pool = torch.cat([contexts.masked_fill(mask.t().unsqueeze(2), -float('inf')),
+                          hiddens.masked_fill(targets.eq(utils.PAD).unsqueeze(2), -float('inf'))], dim=0)
+        label_scores = self.classify(pool)
+        #print(label_scores.size())
+
+        loss = self.compute_loss(outputs, targets, num_tokens) + \
+               self.compute_label_loss(label_scores, label, num_examples)
+        return loss, outputs
+
+    def decode_steps(self, contexts, state, inputs, mask=None):
+        """
+        Teacher-forced decoding of the time-major `inputs` from `state`. The
+        contexts are passed in explicitly so that a checkpointed block attends
+        over the same tensor when it is recomputed during backward.
+        """
+        self.init_context(contexts, mask)
+        outputs, hiddens = [], []
+        for input in inputs.split(1):
+            semantic_output, sentiment_output, state, attn_weights = self.decoder(input.squeeze(0), state)
+            outputs.append(semantic_output)
+            hiddens.append(sentiment_output)
+        return torch.stack(outputs), torch.stack(hiddens), state
+
+    def init_context(self, contexts, mask=None):
+        self.decoder.semantic_attention.init_context(context=contexts, mask=mask)
+        self.decoder.sentiment_attention.init_context(context=contexts, mask=mask)
+
+    def count_correct(self, predicts, label):
+        correct_five = torch.sum(torch.eq(predicts.data, label.data).float())
+        correct_two = torch.sum(torch.eq(torch.ge(predicts.data, 3), torch.ge(label.data, 3)).float())
+        return correct_five, correct_two
+
+    def greedy_steps(self, contexts, state, max_time_step, until_eos=False):
+        """
+        Greedy decoding from encoder outputs, one step at a time. Every step
+        yields the predicted ids, the semantic attention weights and the
+        running max-pool of the encoder outputs and the sentiment outputs so
+        far, the input of the classifier, so a rating is available after
+        any step. With `until_eos` a row stops adding to its pool after it
+        emits </s> and decoding ends once every row has.
+        """
+        input = contexts.new_full((contexts.size(1),), utils.BOS, dtype=torch.long)
+        finished = contexts.new_zeros(contexts.size(1), dtype=torch.bool)
+        pooled = contexts.max(0)[0]
+
+        for i in range(max_time_step):
+            # attached at every step, other batches may be decoded between them
+            self.init_context(contexts)
+            semantic_output, sentiment_output, state, attn_weights = self.decoder(input, state)
+            update = torch.max(pooled, sentiment_output)
+            pooled = torch.where(finished.unsqueeze(1), pooled, update) if until_eos else update
+            input = semantic_output.max(1)[1]
+            #predicted = torch.multinomial(torch.nn.functional.softmax(output/0.6), num_samples=1).squeeze(1)
+            yield input, attn_weights, pooled
+            if until_eos:
+                finished = finished | input.eq(utils.EOS)
+                if bool(finished.all()):
+                    break
+
+    def greedy_decode(self, contexts, state, max_time_step, until_eos=False):
+        """
+        Greedy decoding from encoder outputs. Returns the predicted ids and
+        the semantic attention weights of every step, time-major, and the
+        final max-pool of `greedy_steps`. Decoding with fewer steps yields a
+        prefix of these.
+        """
+        outputs, attn_matrix = [], []
+        for predicted, attn_weights, pooled in self.greedy_steps(contexts, state, max_time_step, until_eos):
+            outputs.append(predicted)
+            attn_matrix.append(attn_weights)
+        return torch.stack(outputs), torch.stack(attn_matrix), pooled
+
+    def sample(self, src, src_len, label, reverse_indices=None):
+
+        # batches from utils.label_sorted_padding arrive already sorted
+        if reverse_indices is None:
+            lengths, indices = torch.sort(src_len, dim=0, descending=True)
+            _, reverse_indices = torch.sort(indices)
+            src = torch.index_select(src, dim=0, index=indices)
+            label = torch.index_select(label, dim=0, index=indices)
+        else:
+            lengths = src_len
+        src = src.t()
+
+        contexts, state = self.encoder(src, lengths.data.tolist())
+        outputs, attn_matrix, pooled = self.greedy_decode(contexts, state, self.config.max_time_step,
+                                                          self.config.until_eos)
+
+        predicts = self.classify(pooled.unsqueeze(0)).max(1)[1]
+        sample_ids = torch.index_select(outputs, dim=1, index=reverse_indices).t().data
+
+        alignments = attn_matrix.max(2)[1]
+        alignments = torch.index_select(alignments, dim=1, index=reverse_indices).t().data
+
+        correct_five, correct_two = self.count_correct(predicts, label)
+
+        return sample_ids, alignments, correct_five, correct_two
+
+    def stream_sample(self, src, src_len, sources, tgt_vocab, reverse_indices=None):
+        """
+        Greedy decoding of a batch-major batch as a generator. After every
+        step it yields ('tokens', words), the word each row decoded in input
+        order, see utils.step_words; with config.unk an <unk> is replaced by
+        the most attended word of the row's tokenized source in `sources`.
+        Rows yield no words after </s>. Last it yields ('label', scores), the
+        rating scores of every row, pooled like `sample` does: up to </s>
+        with config.until_eos, which also ends decoding once every row has
+        emitted it, otherwise over all max_time_step steps.
+        """
+        if reverse_indices is None:
+            lengths, indices = torch.sort(src_len, dim=0, descending=True)
+            _, reverse_indices = torch.sort(indices)
+            src = torch.index_select(src, dim=0, index=indices)
+        else:
+            lengths = src_len
+        src = src.t()
+
+        contexts, state = self.encoder(src, lengths.data.tolist())
+        finished = [False] * len(sources)
+        for predicted, attn_weights, pooled in self.greedy_steps(contexts, state, self.config.max_time_step,
+                                                                 self.config.until_eos):
+            ids = torch.index_select(predicted, dim=0, index=reverse_indices).tolist()
+            alignments = None
+            if self.config.unk:
+                alignments = torch.index_select(attn_weights.max(1)[1], dim=0, index=reverse_indices).tolist()
+            yield 'tokens', utils.step_words(tgt_vocab, ids, alignments, sources, finished)
+
+        scores = self.classify(pooled.unsqueeze(0))
+        yield 'label', torch.index_select(scores, dim=0, index=reverse_indices)
+
+    def sentiment_logits(self, src, src_len, reverse_indices=None, until_eos=False):
+        """Unnormalized rating scores of a batch-major batch, in input order."""
+        if reverse_indices is None:
+            lengths, indices = torch.sort(src_len, dim=0, descending=True)
+            _, reverse_indices = torch.sort(indices)
+            src = torch.index_select(src, dim=0, index=indices)
+        else:
+            lengths = src_len
+        src = src.t()
+
+        contexts, state = self.encoder(src, lengths.data.tolist())
+        # only the last max-pool is kept, not the summary
+        for _, _, pooled in self.greedy_steps(contexts, state, self.config.max_time_step, until_eos):
+            pass
+        scores = self.classify(pooled.unsqueeze(0))
+        return torch.index_select(scores, dim=0, index=reverse_indices)
+
+    def predict_sentiment(self, src, src_len, reverse_indices=None, until_eos=False, temperature=1.0):
+        """
+        Rating probabilities of a batch without decoding the summaries,
+        calibrated by dividing the scores by `temperature`.
+        """
+        scores = self.sentiment_logits(src, src_len, reverse_indices, until_eos)
+        return torch.nn.functional.softmax(scores.float() / temperature, dim=1)
+
+    def beam_decode(self, contexts, encState, beam_size, max_time_step, length_norm=False):
+        """
+        Beam search from encoder outputs. Returns, in encoder (sorted) order,
+        the best hypothesis of every example, its alignments and its
+        sentiment label scores.
+        """
+        batch_size = contexts.size(1)
+
+        #  (1b) Initialize for the decoder.
+        def var(a):
+            return Variable(a, volatile=True)
+
+        def rvar(a):
+            return var(a.repeat(1, beam_size, 1))
+
+        def unbottle(m):
+            return m.view(beam_size, batch_size, -1)
+
+        # Repeat everything beam_size times.
+        if self.config.cell == 'lstm':
+            decState = (rvar(encState[0].data), rvar(encState[1].data))
+        else:
+            decState = rvar(encState.data)
+        beam = [models.Beam(beam_size, n_best=1,
+                            cuda=self.use_cuda, length_norm=length_norm)
+                for __ in range(batch_size)]
+        self.init_context(rvar(contexts.data))
+        # running max-pool of the source and the path of every beam slot
+        pooled = contexts.data.max(0)[0].float().unsqueeze(0).repeat(beam_size, 1, 1)
+
+        # (2) run the decoder to generate sentences, using beam search.
+
+        for i in range(max_time_step):
+
+            if all((b.done() for b in beam)):
+                break
+
+            # Construct batch x beam_size nxt words.
+            # Get all the pending current beam words and arrange for forward.
+            inp = var(torch.stack([b.getCurrentState() for b in beam])
+                      .t().contiguous().view(-1))
+
+            # Run one step.
+            output, hidden, decState, attn = self.decoder(inp, decState)
+
+            # (b) Compute a vector of batch*beam word scores.
+            # beam scores are accumulated in float32
+            output = unbottle(self.log_softmax(output.float()))
+            attn = unbottle(attn.float())
+            pooled = torch.max(pooled, unbottle(hidden.float()).data)
+
+            # (c) Advance each beam.
+            # update state
+            for j, b in enumerate(beam):
+                b.advance(output.data[:, j], attn.data[:, j], pooled[:, j])
+                b.beam_update(decState, j)
+            pooled = torch.stack([b.pooled for b in beam], dim=1)
+
+        # (3) Package everything up.
+        allHyps, allAttn, allPooled = [], [], []
+
+        for j, b in enumerate(beam):
+            scores, ks = b.sortFinished(minimum=1)
+            times, k = ks[0]
+            hyp, att = b.getHyp(times, k)
+            allHyps.append([int(w) for w in hyp])
+            allAttn.append(att.max(1)[1])
+            # the sentiment representation pools over the source and the chosen path only
+            allPooled.append(b.getPooled(times, k))
+
+        label_scores = self._classifier(var(torch.stack(allPooled)))
+
+        return allHyps, allAttn, label_scores
+
+    def beam_sample(self, src, src_len, label, beam_size, reverse_indices=None):
+
+        # (1) Run the encoder on the src.
+
+        if reverse_indices is None:
+            lengths, indices = torch.sort(src_len, dim=0, descending=True)
+            _, ind = torch.sort(indices)
+            src = torch.index_select(src, dim=0, index=indices)
+            label = torch.index_select(label, dim=0, index=indices)
+        else:
+            lengths, ind = src_len, reverse_indices
+        src = src.t()
+        contexts, encState = self.encoder(src, lengths.data.tolist())
+
+        allHyps, allAttn, label_scores = self.beam_decode(contexts, encState, beam_size,
+                                                          self.config.max_time_step, self.config.length_norm)
+
+        predicts = label_scores.max(1)[1]
+        correct_five, correct_two = self.count_correct(predicts, label)
+
+        allHyps = [allHyps[j] for j in ind.tolist()]
+        allAttn = [allAttn[j] for j in ind.tolist()]
+
+        return allHyps, allAttn, correct_five, correct_two
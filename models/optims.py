@@ -1,52 +1,184 @@
-'''
- @Date  : 2017/12/18
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
-'''
-import torch.optim as optim
-from torch.nn.utils import clip_grad_norm
-
-class Optim(object):
-
-    def set_parameters(self, params):
-        self.params = list(params)  # careful: params may be a generator
-        if self.method == 'sgd':
-            self.optimizer = optim.SGD(self.params, lr=self.lr)
-        elif self.method == 'adagrad':
-            self.optimizer = optim.Adagrad(self.params, lr=self.lr)
-        elif self.method == 'adadelta':
-            self.optimizer = optim.Adadelta(self.params, lr=self.lr)
-        elif self.method == 'adam':
-            self.optimizer = optim.Adam(self.params, lr=self.lr)
-        else:
-            raise RuntimeError("Invalid optim method: " + self.method)
-
-    def __init__(self, method, lr, max_grad_norm, lr_decay=1, start_decay_at=None, max_decay_times=2):
-        self.last_score = None
-        self.decay_times = 0
-        self.max_decay_times = max_decay_times
-        self.lr = lr
-        self.max_grad_norm = max_grad_norm
-        self.method = method
-        self.lr_decay = lr_decay
-        self.start_decay_at = start_decay_at
-        self.start_decay = False
-
-    def step(self):
-        # Compute gradients norm.
-        if self.max_grad_norm:
-            clip_grad_norm(self.params, self.max_grad_norm)
-        self.optimizer.step()
-
-    # decay learning rate if val perf does not improve or we hit the start_decay_at limit
-    def updateLearningRate(self, score, epoch):
-        if self.start_decay_at is not None and epoch >= self.start_decay_at:
-            self.start_decay = True
-
-        if self.start_decay:
-            self.lr = self.lr * self.lr_decay
-            print("Decaying learning rate to %g" % self.lr)
-
-        self.last_score = score
-        self.optimizer.param_groups[0]['lr'] = self.lr
+'''
+ @Date  : 2017/12/18
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
+'''
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.nn.utils import clip_grad_norm
+
+
+def sparse_parameters(model):
+    return [m.weight for m in model.modules() if isinstance(m, nn.Embedding) and m.sparse]
+
+
+def clip_mixed_grad_norm(params, max_norm):
+    """clip_grad_norm over a mix of dense and sparse gradients, with one norm across all of them."""
+    total_norm = 0
+    for p in params:
+        if p.grad is None:
+            continue
+        if p.grad.is_sparse:
+            # rows looked up several times appear several times until coalesced
+            p.grad = p.grad.coalesce()
+            total_norm += float(p.grad._values().pow(2).sum())
+        else:
+            total_norm += float(p.grad.data.pow(2).sum())
+    total_norm = total_norm ** 0.5
+    clip_coef = max_norm / (total_norm + 1e-6)
+    if clip_coef < 1:
+        for p in params:
+            if p.grad is not None:
+                p.grad.data.mul_(clip_coef)
+    return total_norm
+
+
+class Adafactor(optim.Optimizer):
+    """
+    Adafactor (Shazeer & Stern, 2018) with an explicit learning rate.
+
+    The second moment of a 2-D weight is kept as running row and column means
+    of the squared gradient, i.e. rows + cols numbers instead of rows * cols;
+    other parameters keep a full second moment. Updates are clipped to an RMS
+    of `clip_threshold`. There is no first moment unless `beta1` is given.
+    """
+
+    def __init__(self, params, lr, beta1=None, decay_rate=-0.8, eps=1e-30, clip_threshold=1.0):
+        defaults = dict(lr=lr, beta1=beta1, decay_rate=decay_rate, eps=eps, clip_threshold=clip_threshold)
+        super(Adafactor, self).__init__(params, defaults)
+
+    def step(self, closure=None):
+        loss = closure() if closure is not None else None
+
+        for group in self.param_groups:
+            for p in group['params']:
+                if p.grad is None:
+                    continue
+                grad = p.grad.data
+                if grad.is_sparse:
+                    raise RuntimeError("Adafactor does not support sparse gradients")
+
+                state = self.state[p]
+                factored = grad.dim() == 2
+                if len(state) == 0:
+                    state['step'] = 0
+                    if factored:
+                        state['exp_avg_sq_row'] = grad.new_zeros(grad.size(0))
+                        state['exp_avg_sq_col'] = grad.new_zeros(grad.size(1))
+                    else:
+                        state['exp_avg_sq'] = torch.zeros_like(grad)
+                    if group['beta1'] is not None:
+                        state['exp_avg'] = torch.zeros_like(grad)
+
+                state['step'] += 1
+                beta2 = 1.0 - state['step'] ** group['decay_rate']
+                grad_sq = grad * grad + group['eps']
+
+                if factored:
+                    row, col = state['exp_avg_sq_row'], state['exp_avg_sq_col']
+                    row.mul_(beta2).add_(grad_sq.mean(1), alpha=1 - beta2)
+                    col.mul_(beta2).add_(grad_sq.mean(0), alpha=1 - beta2)
+                    # v[i, j] ~ row[i] * col[j] / mean(row)
+                    update = grad * (row / row.mean()).rsqrt().unsqueeze(1) * col.rsqrt().unsqueeze(0)
+                else:
+                    exp_avg_sq = state['exp_avg_sq']
+                    exp_avg_sq.mul_(beta2).add_(grad_sq, alpha=1 - beta2)
+                    update = grad * exp_avg_sq.rsqrt()
+
+                update.div_(max(1.0, float(update.pow(2).mean().sqrt()) / group['clip_threshold']))
+
+                if group['beta1'] is not None:
+                    exp_avg = state['exp_avg']
+                    exp_avg.mul_(group['beta1']).add_(update, alpha=1 - group['beta1'])
+                    update = exp_avg
+
+                p.data.add_(update, alpha=-group['lr'])
+
+        return loss
+
+
+class Optim(object):
+
+    def set_parameters(self, params, sparse_params=()):
+        self.params = list(params)  # careful: params may be a generator
+        sparse_ids = set(id(p) for p in sparse_params)
+        self.sparse_params = [p for p in self.params if id(p) in sparse_ids]
+        self.optimizer = self.build_optimizer([p for p in self.params if id(p) not in sparse_ids])
+        self.sparse_optimizer = None
+        if len(self.sparse_params) > 0:
+            self.sparse_optimizer = self.build_optimizer(self.sparse_params, sparse=True)
+
+    def build_optimizer(self, params, sparse=False):
+        if self.method == 'sgd':
+            return optim.SGD(params, lr=self.lr)
+        elif self.method == 'adagrad':
+            return optim.Adagrad(params, lr=self.lr)
+        elif self.method == 'adadelta' and not sparse:
+            return optim.Adadelta(params, lr=self.lr)
+        elif self.method == 'adam':
+            # lazy Adam: only the rows present in the gradient are updated
+            return optim.SparseAdam(params, lr=self.lr) if sparse else optim.Adam(params, lr=self.lr)
+        elif self.method == 'adafactor' and not sparse:
+            return Adafactor(params, lr=self.lr)
+        elif sparse:
+            raise RuntimeError("Optim method %s does not support sparse gradients" % self.method)
+        else:
+            raise RuntimeError("Invalid optim method: " + self.method)
+
+    def __init__(self, method, lr, max_grad_norm, lr_decay=1, start_decay_at=None, max_decay_times=2):
+        self.last_score = None
+        self.decay_times = 0
+        self.max_decay_times = max_decay_times
+        self.lr = lr
+        self.max_grad_norm = max_grad_norm
+        self.method = method
+        self.lr_decay = lr_decay
+        self.start_decay_at = start_decay_at
+        self.start_decay = False
+
+    def state_dict(self):
+        return {'method': self.method,
+                'lr': self.lr,
+                'last_score': self.last_score,
+                'decay_times': self.decay_times,
+                'start_decay': self.start_decay,
+                'optimizer': self.optimizer.state_dict(),
+                'sparse_optimizer': self.sparse_optimizer.state_dict() if self.sparse_optimizer else None}
+
+    def load_state_dict(self, state_dict):
+        if state_dict['method'] != self.method:
+            raise RuntimeError("Checkpoint was trained with %s, not %s" % (state_dict['method'], self.method))
+        self.lr = state_dict['lr']
+        self.last_score = state_dict['last_score']
+        self.decay_times = state_dict['decay_times']
+        self.start_decay = state_dict['start_decay']
+        self.optimizer.load_state_dict(state_dict['optimizer'])
+        if self.sparse_optimizer is not None and state_dict.get('sparse_optimizer') is not None:
+            self.sparse_optimizer.load_state_dict(state_dict['sparse_optimizer'])
+
+    def step(self):
+        # Compute gradients norm.
+        if self.max_grad_norm:
+            if self.sparse_optimizer is not None:
+                clip_mixed_grad_norm(self.params, self.max_grad_norm)
+            else:
+                clip_grad_norm(self.params, self.max_grad_norm)
+        self.optimizer.step()
+        if self.sparse_optimizer is not None:
+            self.sparse_optimizer.step()
+
+    # decay learning rate if val perf does not improve or we hit the start_decay_at limit
+    def updateLearningRate(self, score, epoch):
+        if self.start_decay_at is not None and epoch >= self.start_decay_at:
+            self.start_decay = True
+
+        if self.start_decay:
+            self.lr = self.lr * self.lr_decay
+            print("Decaying learning rate to %g" % self.lr)
+
+        self.last_score = score
+        self.optimizer.param_groups[0]['lr'] = self.lr
+        if self.sparse_optimizer is not None:
+            self.sparse_optimizer.param_groups[0]['lr'] = self.lr
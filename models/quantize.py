@@ -0,0 +1,25 @@
+import torch
+import torch.nn as nn
+import models
+
+
+# modules whose float weights are replaced by int8 ones, activations stay float
+quantized_modules = {nn.Linear, nn.LSTM, nn.GRU, nn.LSTMCell, nn.GRUCell}
+
+
+def quantize_dynamic(model):
+    """
+    A dynamically quantized copy of `model` for CPU inference: the weights of
+    the RNNs, attention layers, classifier and vocabulary projection are
+    stored in int8, embeddings stay float32.
+    """
+    model = torch.quantization.quantize_dynamic(model.cpu().eval(), quantized_modules, dtype=torch.qint8)
+    model.use_cuda = False
+    return model
+
+
+def load_quantized(config, state_dict):
+    """Rebuild a model exported by label_export.py -format int8."""
+    model = quantize_dynamic(getattr(models, config.model)(config))
+    model.load_state_dict(state_dict)
+    return model
@@ -1,6 +1,6 @@
-'''
- @Date  : 2018/1/8
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
+'''
+ @Date  : 2018/1/8
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
 '''
\ No newline at end of file
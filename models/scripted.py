@@ -0,0 +1,115 @@
+import torch
+import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence as pack
+from torch.nn.utils.rnn import pad_packed_sequence as unpack
+from typing import List
+import utils
+
+
+class ScriptedAttention(nn.Module):
+    """`label_attention` with the context passed in instead of stored."""
+
+    def __init__(self, attention):
+        super(ScriptedAttention, self).__init__()
+        self.linear_in = attention.linear_in
+        self.linear_out = attention.linear_out
+
+    def forward(self, context, h, x):
+        gamma_h = self.linear_in(h).unsqueeze(2)    # batch * size * 1
+        weights = torch.softmax(torch.bmm(context, gamma_h).squeeze(2), dim=1)   # batch * time
+        c_t = torch.bmm(weights.unsqueeze(1), context).squeeze(1) # batch * size
+        output = self.linear_out(torch.cat([c_t, h, x], 1))
+        return output, weights
+
+
+class ScriptedEncoder(nn.Module):
+    """`rnn_encoder` for LSTM cells, taking the batch in any order unless `enforce_sorted`."""
+
+    def __init__(self, encoder, enforce_sorted=False):
+        super(ScriptedEncoder, self).__init__()
+        self.embedding = encoder.embedding
+        self.rnn = encoder.rnn
+        self.hidden_size = encoder.hidden_size
+        self.bidirectional = bool(encoder.config.bidirectional)
+        self.num_layers = encoder.config.dec_num_layers
+        self.enforce_sorted = enforce_sorted
+
+    def forward(self, src, lengths):
+        embs = pack(self.embedding(src), lengths.cpu(), enforce_sorted=self.enforce_sorted)
+        outputs, (h, c) = self.rnn(embs)
+        outputs = unpack(outputs)[0]
+        if self.bidirectional:
+            outputs = outputs[:, :, :self.hidden_size] + outputs[:, :, self.hidden_size:]
+        return outputs, h[:self.num_layers], c[:self.num_layers]
+
+
+class ScriptedDecoder(nn.Module):
+    """One step of `label_rnn_decoder` for LSTM cells, without dropout."""
+
+    def __init__(self, decoder):
+        super(ScriptedDecoder, self).__init__()
+        self.embedding = decoder.embedding
+        self.layers = decoder.rnn.layers
+        self.semantic_attention = ScriptedAttention(decoder.semantic_attention)
+        self.sentiment_attention = ScriptedAttention(decoder.sentiment_attention)
+        self.linear = decoder.linear
+
+    def forward(self, input, h, c, context):
+        embs = self.embedding(input)
+        output = embs
+        h_1: List[torch.Tensor] = []
+        c_1: List[torch.Tensor] = []
+        for i, layer in enumerate(self.layers):
+            h_1_i, c_1_i = layer(output, (h[i], c[i]))
+            output = h_1_i
+            h_1.append(h_1_i)
+            c_1.append(c_1_i)
+
+        semantic_output, weights = self.semantic_attention(context, output, embs)
+        sentiment_output, _ = self.sentiment_attention(context, output, embs)
+        return self.linear(semantic_output), sentiment_output, torch.stack(h_1), torch.stack(c_1), weights
+
+
+class ScriptedLabel(nn.Module):
+    """
+    Greedy decoding and sentiment classification of a trained `label` model
+    in one call, written so that it compiles with torch.jit.script.
+    """
+
+    def __init__(self, model):
+        super(ScriptedLabel, self).__init__()
+        if model.config.cell != 'lstm':
+            raise ValueError("only LSTM models can be scripted")
+        self.encoder = ScriptedEncoder(model.encoder)
+        self.decoder = ScriptedDecoder(model.decoder)
+        self.classifier = model._classifier
+        self.bos = utils.BOS
+
+    def forward(self, src, lengths, max_time_step: int):
+        """
+        `src` is batch * time and need not be sorted by `lengths`. Returns the
+        predicted ids and alignments (batch * max_time_step) and the label
+        scores, all in the order of the input.
+        """
+        contexts, h, c = self.encoder(src.t(), lengths)
+        context = contexts.transpose(0, 1)
+
+        input = torch.full([src.size(0)], self.bos, dtype=torch.long, device=src.device)
+        pooled = contexts.max(0)[0]
+        outputs: List[torch.Tensor] = []
+        attn_matrix: List[torch.Tensor] = []
+        for _ in range(max_time_step):
+            scores, hidden, h, c, weights = self.decoder(input, h, c, context)
+            input = scores.max(1)[1]
+            outputs.append(input)
+            attn_matrix.append(weights.max(1)[1])
+            pooled = torch.max(pooled, hidden)
+
+        label_scores = self.classifier(pooled)
+        return torch.stack(outputs, dim=1), torch.stack(attn_matrix, dim=1), label_scores
+
+
+def script_label(model):
+    """A TorchScript module of `model` that torch.jit.load restores without this repo."""
+    model.eval()
+    return torch.jit.script(ScriptedLabel(model).eval())
@@ -0,0 +1,125 @@
+'''
+ Greedy summarization and sentiment classification with the ONNX graphs
+ written by label_export.py -format onnx. Needs numpy and onnxruntime only.
+
+ python onnx_predict.py -model movie_onnx/ -src_dict data/src.dict -tgt_dict data/tgt.dict \
+     -src_file reviews.txt -out predictions.txt
+
+ Every input line gives one output line: the summary, a tab and the rating.
+'''
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import onnxruntime as ort
+
+parser = argparse.ArgumentParser(description='onnx_predict.py')
+parser.add_argument('-model', required=True, type=str, help="directory written by label_export.py -format onnx")
+parser.add_argument('-src_dict', required=True, type=str, help="src.dict of the preprocessed data")
+parser.add_argument('-tgt_dict', required=True, type=str, help="tgt.dict of the preprocessed data")
+parser.add_argument('-src_file', required=True, type=str, help="tokenized reviews, one per line")
+parser.add_argument('-out', default='', type=str, help="output file, stdout by default")
+parser.add_argument('-batch_size', type=int, default=64, help="reviews decoded together")
+parser.add_argument('-max_time_step', type=int, default=0, help="summary length, that of the export by default")
+parser.add_argument('-src_trun', type=int, default=0, help="truncate reviews to this many words")
+parser.add_argument('-threads', type=int, default=0, help="onnxruntime intra-op threads, 0 for the default")
+parser.add_argument('-unk', action='store_true', help="replace unk by the most attended source word")
+
+
+def load_dict(path):
+    """Entries of a Dict.writeFile file, `label idx` per line."""
+    vocab = {}
+    for line in open(path, encoding='utf8'):
+        fields = line.split()
+        vocab[fields[0]] = int(fields[1])
+    return vocab
+
+
+class Decoder(object):
+
+    def __init__(self, path, src_vocab, tgt_vocab, threads=0):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+
+        def session(name):
+            return ort.InferenceSession(os.path.join(path, name), options, providers=['CPUExecutionProvider'])
+
+        self.encoder = session('encoder.onnx')
+        self.step = session('step.onnx')
+        self.classifier = session('classifier.onnx')
+        self.config = json.load(open(os.path.join(path, 'config.json')))
+        self.src_vocab = src_vocab
+        self.tgt_words = {idx: word for word, idx in tgt_vocab.items()}
+
+    def __call__(self, sources, max_time_step, unk=False):
+        """Summaries and ratings of a batch of tokenized sources, in input order."""
+        config = self.config
+        ids = [[self.src_vocab.get(w, config['unk']) for w in s] or [config['unk']] for s in sources]
+        # the encoder graph expects a batch sorted by decreasing length
+        order = sorted(range(len(ids)), key=lambda i: -len(ids[i]))
+        lengths = np.array([len(ids[i]) for i in order], dtype=np.int64)
+        src = np.full((lengths[0], len(ids)), config['pad'], dtype=np.int64)
+        for j, i in enumerate(order):
+            src[:len(ids[i]), j] = ids[i]
+
+        contexts, h, c = self.encoder.run(None, {'src': src, 'lengths': lengths})
+        context = np.ascontiguousarray(contexts.transpose(1, 0, 2))
+
+        input = np.full(len(ids), config['bos'], dtype=np.int64)
+        state = contexts.max(0)
+        outputs, alignments = [], []
+        for _ in range(max_time_step):
+            scores, hidden, h, c, attention = self.step.run(None, {'input': input, 'h': h, 'c': c,
+                                                                   'context': context})
+            input = scores.argmax(1)
+            outputs.append(input)
+            alignments.append(attention.argmax(1))
+            state = np.maximum(state, hidden)
+
+        label_scores = self.classifier.run(None, {'state': state})[0]
+
+        outputs, alignments = np.stack(outputs, 1), np.stack(alignments, 1)
+        results = [None] * len(ids)
+        for j, i in enumerate(order):
+            words = []
+            for w, a in zip(outputs[j].tolist(), alignments[j].tolist()):
+                if w == config['eos']:
+                    break
+                if unk and w == config['unk'] and a < len(sources[i]):
+                    words.append(sources[i][a])
+                else:
+                    words.append(self.tgt_words.get(w, '<unk>'))
+            results[i] = (words, int(label_scores[j].argmax()) + 1)
+        return results
+
+
+def main():
+    opt = parser.parse_args()
+    decoder = Decoder(opt.model, load_dict(opt.src_dict), load_dict(opt.tgt_dict), opt.threads)
+    max_time_step = opt.max_time_step or decoder.config['max_time_step']
+    out = open(opt.out, 'w', encoding='utf8') if opt.out else sys.stdout
+
+    def flush(batch):
+        for words, rating in decoder(batch, max_time_step, opt.unk):
+            out.write('%s\t%d\n' % (' '.join(words), rating))
+
+    batch = []
+    for line in open(opt.src_file, encoding='utf8'):
+        words = line.strip().lower().split()
+        batch.append(words[:opt.src_trun] if opt.src_trun > 0 else words)
+        if len(batch) == opt.batch_size:
+            flush(batch)
+            batch = []
+    if len(batch) > 0:
+        flush(batch)
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,84 @@
-'''
- @Date  : 2017/12/19
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
-'''
-
-
-def model_opts(parser):
-
-    parser.add_argument('-config', default='default.yaml', type=str,
-                        help="config file")
-    parser.add_argument('-gpus', default=[], nargs='+', type=int,
-                        help="Use CUDA on the listed devices.")
-    parser.add_argument('-restore', default='', type=str,
-                        help="restore checkpoint")
-    parser.add_argument('-seed', type=int, default=1234,
-                        help="Random seed")
-    parser.add_argument('-mode', default='train', type=str,
-                        help="train or eval")
-    parser.add_argument('-model', default='seq2seq', type=str,
-                        help="Model selection")
-    parser.add_argument('-module', default='seq2seq', type=str,
-                        help="Module selection")
-    parser.add_argument('-log', default='', type=str,
-                        help="log directory")
-    parser.add_argument('-num_processes', type=int, default=4,
-                        help="number of processes")
-    parser.add_argument('-refF', default='', type=str,
-                        help="reference file")
-    parser.add_argument('-unk', action='store_true', help='replace unk')
-    parser.add_argument('-char', action='store_true', help='char level decoding')
-    parser.add_argument('-length_norm', action='store_true', help='replace unk')
-    parser.add_argument('-pool_size', type=int, default=0, help="pool size of maxout layer")
-    parser.add_argument('-scale', type=float, default=1, help="proportion of the training set")
-    parser.add_argument('-max_split', type=int, default=0, help="max generator time steps for memory efficiency")
-    parser.add_argument('-split_num', type=int, default=0, help="split number for splitres")
-    parser.add_argument('-pretrain', default='', type=str, help="load pretrain encoder")
-
-
-def convert_to_config(opt, config):
-    opt = vars(opt)
-    for key in opt:
-        if key not in config:
-            config[key] = opt[key]
+'''
+ @Date  : 2017/12/19
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
+'''
+
+
+def model_opts(parser):
+
+    parser.add_argument('-config', default='default.yaml', type=str,
+                        help="config file")
+    parser.add_argument('-gpus', default=[], nargs='+', type=int,
+                        help="Use CUDA on the listed devices.")
+    parser.add_argument('-restore', default='', type=str,
+                        help="restore checkpoint")
+    parser.add_argument('-seed', type=int, default=1234,
+                        help="Random seed")
+    parser.add_argument('-mode', default='train', type=str,
+                        help="train or eval")
+    parser.add_argument('-model', default='seq2seq', type=str,
+                        help="Model selection")
+    parser.add_argument('-module', default='seq2seq', type=str,
+                        help="Module selection")
+    parser.add_argument('-log', default='', type=str,
+                        help="log directory")
+    parser.add_argument('-num_processes', type=int, default=4,
+                        help="number of processes")
+    parser.add_argument('-refF', default='', type=str,
+                        help="reference file")
+    parser.add_argument('-unk', action='store_true', help='replace unk')
+    parser.add_argument('-char', action='store_true', help='char level decoding')
+    parser.add_argument('-length_norm', action='store_true', help='replace unk')
+    parser.add_argument('-pool_size', type=int, default=0, help="pool size of maxout layer")
+    parser.add_argument('-scale', type=float, default=1, help="proportion of the training set")
+    parser.add_argument('-max_split', type=int, default=0, help="max generator time steps for memory efficiency")
+    parser.add_argument('-split_num', type=int, default=0, help="split number for splitres")
+    parser.add_argument('-pretrain', default='', type=str, help="load pretrain encoder")
+    parser.add_argument('-valid_cache', default='', type=str,
+                        help="file to store the collated validation batches in")
+    parser.add_argument('-keep_checkpoints', type=int, default=5,
+                        help="number of periodic checkpoints to keep")
+    parser.add_argument('-accum_steps', type=int, default=1,
+                        help="number of batches whose gradients are accumulated per update")
+    parser.add_argument('-distributed', action='store_true',
+                        help="data parallel training with -num_processes processes per node")
+    parser.add_argument('-sparse_embedding', action='store_true',
+                        help="sparse embedding gradients, updated by a sparse optimizer")
+    parser.add_argument('-hogwild', action='store_true',
+                        help="asynchronous training of a shared model by -num_processes processes")
+    parser.add_argument('-num_nodes', type=int, default=1,
+                        help="number of nodes for distributed training")
+    parser.add_argument('-node_rank', type=int, default=0,
+                        help="rank of this node for distributed training")
+    parser.add_argument('-dist_url', default='tcp://127.0.0.1:23456', type=str,
+                        help="address of the first node for distributed training")
+    parser.add_argument('-dist_timeout', type=int, default=7200,
+                        help="seconds the other processes wait for an evaluation on the first one")
+    parser.add_argument('-checkpoint_segment', type=int, default=0,
+                        help="decoder steps recomputed together during backward, 0 stores all activations")
+    parser.add_argument('-checkpoint_encoder', action='store_true',
+                        help="recompute the encoder during backward instead of storing its activations")
+    parser.add_argument('-bf16', action='store_true',
+                        help="bfloat16 autocast for training and decoding, weights and losses stay float32")
+    parser.add_argument('-cache_mb', type=float, default=0,
+                        help="megabytes of predictions kept in memory for repeated reviews, 0 disables")
+    parser.add_argument('-cache_db', default='', type=str,
+                        help="SQLite file that keeps the cached predictions across runs")
+    parser.add_argument('-temperature', type=float, default=0,
+                        help="divides the rating scores before the softmax, "
+                             "0 uses the one fitted by label_calibrate.py or 1")
+    parser.add_argument('-trust_checkpoint', action='store_true',
+                        help="unpickle a -restore checkpoint that holds more than tensors, "
+                             "which runs the code stored in it")
+    parser.add_argument('-until_eos', action='store_true',
+                        help="greedy decoding stops once every review has emitted </s>, "
+                             "whose rating pools only up to it")
+
+
+def convert_to_config(opt, config):
+    opt = vars(opt)
+    for key in opt:
+        if key not in config:
+            config[key] = opt[key]
@@ -0,0 +1,496 @@
+'''
+ HTTP inference server for the label model with dynamic micro-batching.
+
+ python server.py -config movie.yaml -restore best.pt -port 8000 [-scheduler continuous | -workers 8]
+
+ POST /predict    {"text": "..."} or {"texts": ["...", ...]}
+ POST /sentiment  the same, answered with the ratings only
+ POST /stream     the same, answered by a chunked stream of JSON lines: every
+                  decoded word as {"token": ...}, then the prediction
+                  ("index" tells the reviews of {"texts": [...]} apart);
+                  greedy decoding only
+ GET  /stats      request latency percentiles, the batch size histogram and cache hit rates
+'''
+
+import torch
+import argparse
+import copy
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import opts
+import utils
+from inference import load_predictor, build_cache, DecodingPool
+
+parser = argparse.ArgumentParser(description='server.py')
+opts.model_opts(parser)
+parser.set_defaults(model='label')
+parser.add_argument('-host', default='127.0.0.1', type=str, help="address to listen on")
+parser.add_argument('-port', default=8000, type=int, help="port to listen on")
+parser.add_argument('-scheduler', default='micro', type=str,
+                    help="micro: batches decoded to the end, "
+                         "continuous: greedy decoding that reviews join and leave between steps")
+parser.add_argument('-max_batch_size', default=32, type=int, help="most reviews decoded together")
+parser.add_argument('-max_wait_ms', default=10, type=float,
+                    help="longest time a review waits for others to share its batch")
+parser.add_argument('-src_trun', type=int, default=0, help="truncate reviews to this many words")
+parser.add_argument('-workers', type=int, default=0,
+                    help="decoding processes sharing the model weights, 0 decodes in the server process")
+
+opt = parser.parse_args()
+config = utils.read_config(opt.config)
+torch.manual_seed(opt.seed)
+opts.convert_to_config(opt, config)
+
+# cuda
+use_cuda = torch.cuda.is_available() and len(opt.gpus) > 0
+config.use_cuda = use_cuda
+if use_cuda:
+    torch.cuda.set_device(opt.gpus[0])
+
+
+class Request(object):
+
+    def __init__(self, source, key=None, sentiment=False):
+        self.source = source
+        self.key = key
+        self.sentiment = sentiment
+        self.arrival = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Stats(object):
+    """Latencies of the last `window` requests and counts of batch sizes."""
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = {}
+        self.requests, self.batches = 0, 0
+        self.start_time = time.time()
+
+    def record_batch(self, size):
+        with self.lock:
+            self.batches += 1
+            self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+
+    def record_requests(self, requests):
+        now = time.time()
+        with self.lock:
+            self.requests += len(requests)
+            self.latencies.extend(now - r.arrival for r in requests)
+
+    def summary(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            summary = {'requests': self.requests, 'batches': self.batches,
+                       'requests_per_second': self.requests / (time.time() - self.start_time),
+                       'batch_sizes': dict(sorted(self.batch_sizes.items()))}
+        if len(latencies) > 0:
+            summary['latency_ms'] = {'p%d' % q: round(1000 * latencies[min(len(latencies) - 1,
+                                                                           len(latencies) * q // 100)], 2)
+                                     for q in (50, 90, 95, 99)}
+        return summary
+
+
+class MicroBatcher(object):
+    """
+    Reviews submitted by the handler threads are queued and decoded by one
+    thread in batches of at most `max_batch_size`. A batch is started once it
+    is full or its first review has waited `max_wait` seconds.
+    """
+
+    def __init__(self, predictor, max_batch_size, max_wait):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.stats = Stats()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, texts, sentiment=False):
+        sources = [self.predictor.tokenize(text) for text in texts]
+        if self.predictor.cache is not None:
+            keys, cached = self.predictor.lookup(sources, sentiment)
+        else:
+            keys, cached = [None] * len(sources), [None] * len(sources)
+        requests = [Request(source, key, sentiment) for source, key in zip(sources, keys)]
+        # cache hits are answered without queueing
+        hits = []
+        for request, result in zip(requests, cached):
+            if result is not None:
+                request.result = result
+                request.done.set()
+                hits.append(request)
+            else:
+                self.enqueue(request)
+        self.stats.record_requests(hits)
+        for request in requests:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+        return [request.result for request in requests]
+
+    def enqueue(self, request):
+        self.queue.put(request)
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = batch[0].arrival + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def store(self, requests):
+        for request in requests:
+            if request.key is not None and request.result is not None:
+                self.predictor.cache.put(request.key, request.result)
+
+    def finish(self, requests):
+        """Caches and records answered requests, then wakes their handlers whatever fails."""
+        try:
+            self.store(requests)
+            self.stats.record_requests(requests)
+        except Exception as e:
+            for request in requests:
+                request.error = e
+        finally:
+            for request in requests:
+                request.done.set()
+
+    def loop(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                self.stats.record_batch(len(batch))
+                results = decode_batch(self.predictor, [r.source for r in batch], [r.sentiment for r in batch],
+                                       self.max_batch_size)
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            self.finish(batch)
+
+
+class ContinuousBatcher(MicroBatcher):
+    """
+    Greedy decoding with iteration-level scheduling: queued reviews are
+    encoded and join the decoding pool between steps while it has fewer than
+    `max_batch_size` rows, and each review is answered as soon as it emits
+    </s>. Sentiment-only reviews are decoded apart, between steps. The batch
+    size histogram counts pool sizes per decoder step.
+    """
+
+    def __init__(self, predictor, max_batch_size, max_wait=0):
+        self.pool = DecodingPool(predictor)
+        super(ContinuousBatcher, self).__init__(predictor, max_batch_size, max_wait)
+
+    def admit(self):
+        requests = []
+        if len(self.pool) == 0:
+            requests.append(self.queue.get())
+        while len(self.pool) + len(requests) < self.max_batch_size:
+            try:
+                requests.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(requests) == 0:
+            return
+        ratings = [r for r in requests if r.sentiment]
+        requests = [r for r in requests if not r.sentiment]
+        if len(ratings) > 0:
+            try:
+                results = self.predictor.decode_sorted([r.source for r in ratings], self.max_batch_size,
+                                                       sentiment=True)
+                for request, result in zip(ratings, results):
+                    request.result = result
+            except Exception as e:
+                for request in ratings:
+                    request.error = e
+            self.finish(ratings)
+        if len(requests) == 0:
+            return
+        try:
+            self.pool.add([r.source for r in requests], requests)
+        except Exception as e:
+            for request in requests:
+                request.error = e
+                request.done.set()
+
+    def loop(self):
+        while True:
+            try:
+                self.admit()
+                # admit may have answered only sentiment-only reviews
+                if len(self.pool) == 0:
+                    continue
+                self.stats.record_batch(len(self.pool))
+                finished = self.pool.step()
+            except Exception as e:
+                finished = []
+                for request in self.pool.clear():
+                    request.error = e
+                    finished.append((request, None))
+            for request, result in finished:
+                request.result = result
+            self.finish([request for request, _ in finished])
+
+
+def decode_batch(predictor, sources, sentiment, batch_size):
+    """Results of a batch that mixes full and sentiment-only reviews, in batch order."""
+    results = [None] * len(sources)
+    for flag in (False, True):
+        index = [i for i in range(len(sources)) if sentiment[i] == flag]
+        if len(index) > 0:
+            decoded = predictor.decode_sorted([sources[i] for i in index], batch_size, sentiment=flag)
+            for i, result in zip(index, decoded):
+                results[i] = result
+    return results
+
+
+def worker_loop(predictor, requests, answers, max_batch_size, max_wait):
+    """
+    Decoding loop of a worker process: micro-batches of (id, source, sentiment)
+    from `requests`, answered on `answers` as lists of (id, result, error).
+    """
+    torch.set_num_threads(1)
+    while True:
+        batch = [requests.get()]
+        deadline = time.time() + max_wait
+        while len(batch) < max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        try:
+            results = decode_batch(predictor, [source for _, source, _ in batch],
+                                   [sentiment for _, _, sentiment in batch], max_batch_size)
+            answers.put([(id, result, None) for (id, _, _), result in zip(batch, results)])
+        except Exception as e:
+            answers.put([(id, None, str(e)) for id, _, _ in batch])
+
+
+class WorkerPool(MicroBatcher):
+    """
+    Micro-batching over `num_workers` forked processes with one intra-op
+    thread each. The parameters are moved to shared memory before the fork,
+    so the workers read the weights of the one copy the parent loaded.
+    Every review goes to the queue of the worker with the fewest pending
+    reviews. If a worker dies, the reviews it held fail and it is restarted.
+    """
+
+    def __init__(self, predictor, num_workers, max_batch_size, max_wait):
+        if predictor.config.use_cuda:
+            raise ValueError("worker processes decode on the CPU")
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = Stats()
+        # id -> (request, index of the worker that holds it)
+        self.pending, self.ids, self.lock = {}, itertools.count(), threading.Lock()
+
+        predictor.model.share_memory()
+        # a restart forks the server process, whose predictor lock may be held by
+        # a stream and whose cache is open; the workers use neither
+        self.worker_predictor = copy.copy(predictor)
+        self.worker_predictor.lock, self.worker_predictor.cache = threading.Lock(), None
+        self.context = torch.multiprocessing.get_context('fork')
+        self.answers = self.context.Queue()
+        self.workers, self.queues = [None] * num_workers, [None] * num_workers
+        for k in range(num_workers):
+            self.start_worker(k)
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def start_worker(self, k):
+        self.queues[k] = self.context.Queue()
+        self.workers[k] = self.context.Process(target=worker_loop, daemon=True,
+                                               args=(self.worker_predictor, self.queues[k], self.answers,
+                                                     self.max_batch_size, self.max_wait))
+        self.workers[k].start()
+
+    def enqueue(self, request):
+        with self.lock:
+            id = next(self.ids)
+            load = [0] * len(self.workers)
+            for _, k in self.pending.values():
+                load[k] += 1
+            k = min(range(len(load)), key=lambda k: load[k])
+            self.pending[id] = (request, k)
+            # under the lock, so that a restart cannot replace the queue in between
+            self.queues[k].put((id, request.source, request.sentiment))
+
+    def loop(self):
+        while True:
+            try:
+                answers = self.answers.get(timeout=1.0)
+            except queue.Empty:
+                answers = []
+            self.check_workers()
+            batch = []
+            with self.lock:
+                for id, result, error in answers:
+                    # reviews failed for a dead worker are no longer pending
+                    request, _ = self.pending.pop(id, (None, None))
+                    if request is not None:
+                        request.result = result
+                        request.error = RuntimeError(error) if error is not None else None
+                        batch.append(request)
+            if len(batch) == 0:
+                continue
+            self.stats.record_batch(len(batch))
+            self.finish(batch)
+
+    def check_workers(self):
+        for k, worker in enumerate(self.workers):
+            if worker.is_alive():
+                continue
+            with self.lock:
+                ids = [id for id, (_, owner) in self.pending.items() if owner == k]
+                failed = [self.pending.pop(id)[0] for id in ids]
+                # the dead worker may have left its queue locked
+                self.queues[k].cancel_join_thread()
+                self.queues[k].close()
+                self.start_worker(k)
+            print('decoding worker %d exited (code %s) and was restarted, %d reviews failed'
+                  % (k, worker.exitcode, len(failed)), file=sys.stderr)
+            for request in failed:
+                request.error = RuntimeError("decoding worker exited with code %s" % worker.exitcode)
+            self.finish(failed)
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    # chunked transfer encoding needs HTTP/1.1
+    protocol_version = 'HTTP/1.1'
+    batcher = None
+
+    def send_json(self, code, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def send_stream(self, texts, indexed):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        lines = self.stream_lines(texts, indexed)
+        try:
+            for line in lines:
+                self.write_chunk(line)
+            self.write_chunk(b'')
+        except OSError:
+            # the client went away, decoding stops with the writes
+            self.close_connection = True
+        finally:
+            lines.close()
+
+    def stream_lines(self, texts, indexed):
+        try:
+            for i, event in self.batcher.predictor.stream_tokens(texts):
+                if indexed:
+                    event = dict(event, index=i)
+                yield json.dumps(event, ensure_ascii=False).encode('utf8') + b'\n'
+        except Exception as e:
+            # the status is already sent, the error is the last line
+            yield json.dumps({'error': str(e)}).encode('utf8') + b'\n'
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def read_json(self):
+        return json.loads(self.read_body().decode('utf8'))
+
+    def do_GET(self):
+        if self.path == '/stats':
+            stats = self.batcher.stats.summary()
+            if self.batcher.predictor.cache is not None:
+                stats['cache'] = self.batcher.predictor.cache.stats()
+            self.send_json(200, stats)
+        elif self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': 'unknown path %s' % self.path})
+
+    def do_POST(self):
+        if self.path not in ('/predict', '/sentiment', '/stream'):
+            # read anyway, the kept-alive connection would parse the body as the next request
+            self.read_body()
+            self.send_json(404, {'error': 'unknown path %s' % self.path})
+            return
+        try:
+            request = self.read_json()
+            texts = request['texts'] if 'texts' in request else [request['text']]
+        except (ValueError, KeyError, TypeError):
+            # a bad Content-Length leaves the body unread
+            self.close_connection = True
+            self.send_json(400, {'error': 'expected {"text": ...} or {"texts": [...]}'})
+            return
+        if self.path == '/stream':
+            if self.batcher.predictor.config.beam_size > 1:
+                self.send_json(400, {'error': 'only greedy decoding can be streamed'})
+                return
+            self.send_stream(texts, 'texts' in request)
+            return
+        try:
+            results = self.batcher.submit(texts, sentiment=self.path == '/sentiment')
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+            return
+        self.send_json(200, {'results': results} if 'texts' in request else results[0])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    if not opt.restore:
+        raise ValueError("-restore must name a trained checkpoint")
+    continuous = opt.scheduler == 'continuous' and opt.workers == 0
+    predictor = load_predictor(config, opt.restore, src_trun=opt.src_trun, continuous=continuous)
+    if opt.workers > 0:
+        Handler.batcher = WorkerPool(predictor, opt.workers, opt.max_batch_size, opt.max_wait_ms / 1000.0)
+    elif continuous:
+        Handler.batcher = ContinuousBatcher(predictor, opt.max_batch_size)
+    else:
+        Handler.batcher = MicroBatcher(predictor, opt.max_batch_size, opt.max_wait_ms / 1000.0)
+    # opened after the workers are forked, only the server process reads and writes the cache
+    predictor.cache = build_cache(config)
+
+    server = ThreadingHTTPServer((opt.host, opt.port), Handler)
+    print('serving on http://%s:%d' % (opt.host, opt.port), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
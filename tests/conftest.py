@@ -0,0 +1,56 @@
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# small enough to train on a CPU in a few seconds
+TINY_CONFIG = {'data': '', 'epoch': 1, 'batch_size': 4, 'num_label': 5, 'optim': 'adam', 'cell': 'lstm',
+               'attention': 'luong', 'learning_rate': 0.01, 'max_grad_norm': 10, 'learning_rate_decay': 0.5,
+               'start_decay_at': 5, 'emb_size': 8, 'hidden_size': 8, 'dec_num_layers': 1, 'enc_num_layers': 1,
+               'bidirectional': True, 'dropout': 0.0, 'max_time_step': 6, 'eval_interval': 1000,
+               'save_interval': 1000, 'metrics': [], 'shared_vocab': True, 'beam_size': 1, 'unk': False,
+               'src_vocab_size': 20, 'tgt_vocab_size': 20}
+
+
+def make_examples(n, seed=0):
+    """(src, tgt, label, original_src, original_tgt) examples of different lengths, as LabelDataset gives."""
+    import utils
+    rng = random.Random(seed)
+    examples = []
+    for _ in range(n):
+        src = [rng.randrange(4, 20) for _ in range(rng.randint(2, 9))]
+        tgt = [utils.BOS] + [rng.randrange(4, 20) for _ in range(rng.randint(1, 5))] + [utils.EOS]
+        examples.append((src, tgt, rng.randrange(5), ['w%d' % i for i in src], ['w%d' % i for i in tgt[1:-1]]))
+    return examples
+
+
+@pytest.fixture
+def config():
+    import argparse
+    import opts
+    import utils
+    config = utils.AttrDict(TINY_CONFIG)
+    parser = argparse.ArgumentParser()
+    opts.model_opts(parser)
+    opts.convert_to_config(parser.parse_args([]), config)
+    config.use_cuda = False
+    return config
+
+
+@pytest.fixture(scope='session')
+def label_train(tmp_path_factory):
+    """label_train.py imported with the tiny config instead of a config file and command line."""
+    import utils
+    argv, read_config = sys.argv, utils.read_config
+    log_dir = str(tmp_path_factory.mktemp('experiments')) + '/'
+    sys.argv = ['label_train.py', '-model', 'label', '-log', 'test']
+    utils.read_config = lambda path: utils.AttrDict(TINY_CONFIG, logF=log_dir)
+    try:
+        import label_train
+    finally:
+        sys.argv, utils.read_config = argv, read_config
+    return label_train
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+import utils
+
+
+def test_checkpoint_rotation_counts_files_of_earlier_runs(tmp_path):
+    for updates in (1, 2):
+        path = str(tmp_path / ('checkpoint_%d.pt' % updates))
+        utils.atomic_save({'updates': updates}, path)
+        os.utime(path, (updates, updates))
+    saver = utils.CheckpointSaver(keep=2, pattern=str(tmp_path / 'checkpoint_*.pt'))
+    saver.save(str(tmp_path / 'checkpoint_3.pt'), {'updates': 3}, rotate=True)
+    saver.close()
+    assert sorted(p.name for p in tmp_path.glob('checkpoint_*.pt')) == ['checkpoint_2.pt', 'checkpoint_3.pt']
+
+
+def test_failed_checkpoint_write_is_raised(tmp_path):
+    saver = utils.CheckpointSaver()
+    saver.save(str(tmp_path / 'missing' / 'checkpoint.pt'), {'updates': 1})
+    with pytest.raises(RuntimeError):
+        saver.wait()
+    saver.close()
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+import models
+import utils
+from conftest import ROOT
+
+
+def test_lazy_names_resolve():
+    # the metrics need pyrouge
+    for package, names in ((models, models.lazy_names), (utils, [n for n, m in utils.lazy_names.items()
+                                                                   if m != 'metrics'])):
+        for name in names:
+            assert hasattr(package, name), name
+
+
+def test_utils_import_is_lazy():
+    # a fresh interpreter, the test session has loaded everything already
+    code = 'import sys, utils; print(" ".join(sorted(sys.modules)))'
+    loaded = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT).decode().split()
+    for module in ('sqlite3', 'utils.checkpoint_helper', 'utils.dist_helper', 'utils.cache_helper'):
+        assert module not in loaded, module
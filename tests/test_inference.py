@@ -0,0 +1,81 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+import models
+import utils
+from conftest import make_examples
+from inference import DecodingPool, Predictor
+
+
+def build_predictor(config, model='label', **settings):
+    config.update(model=model, temperature=1.0, **settings)
+    vocab = utils.Dict([utils.PAD_WORD, utils.UNK_WORD, utils.BOS_WORD, utils.EOS_WORD])
+    for i in range(4, config.tgt_vocab_size):
+        vocab.add('w%d' % i)
+    torch.manual_seed(1)
+    return Predictor(getattr(models, model)(config).eval(), vocab, vocab, config)
+
+
+def review_texts(n):
+    return [' '.join(example[3]) for example in make_examples(n)]
+
+
+def stream_results(predictor, texts):
+    tokens, results = [[] for _ in texts], [None] * len(texts)
+    for i, event in predictor.stream_tokens(texts):
+        if 'token' in event:
+            assert results[i] is None, 'a token after the prediction'
+            tokens[i].append(event['token'])
+        else:
+            results[i] = event
+    return tokens, results
+
+
+@pytest.mark.parametrize('until_eos', [False, True])
+def test_stream_ends_with_the_prediction_of_decode(config, until_eos):
+    predictor = build_predictor(config, until_eos=until_eos)
+    texts = review_texts(6)
+    tokens, results = stream_results(predictor, texts)
+    assert results == predictor.predict(texts, batch_size=len(texts))
+    for words, result in zip(tokens, results):
+        assert ' '.join(words) == result['summary']
+
+
+def test_stream_of_seq2seq_ends_with_the_summaries(config):
+    predictor = build_predictor(config, model='seq2seq')
+    tokens, results = stream_results(predictor, review_texts(4))
+    for words, result in zip(tokens, results):
+        assert result == {'summary': ' '.join(words)}
+
+
+def test_stream_rejects_beam_search(config):
+    predictor = build_predictor(config, beam_size=2)
+    with pytest.raises(ValueError):
+        next(predictor.stream_tokens(review_texts(1)))
+
+
+@pytest.mark.parametrize('until_eos', [False, True])
+def test_decoding_pool_matches_batches_of_one(config, until_eos):
+    predictor = build_predictor(config, until_eos=until_eos)
+    sources = [predictor.tokenize(text) for text in review_texts(6)]
+    pool = DecodingPool(predictor)
+    results = {}
+    pool.add(sources[:3], [0, 1, 2])
+    for _ in range(2):
+        results.update(pool.step())
+    # reviews of other lengths join rows that are half decoded
+    pool.add(sources[3:], [3, 4, 5])
+    while len(pool) > 0:
+        results.update(pool.step())
+
+    for i, source in enumerate(sources):
+        expected = predictor.decode([source])[0]
+        assert results[i]['summary'] == expected['summary']
+        assert results[i]['label'] == expected['label']
+        assert results[i]['probs'] == pytest.approx(expected['probs'], abs=1e-3)
+
+
+def test_decoding_pool_rejects_beam_search(config):
+    with pytest.raises(ValueError):
+        DecodingPool(build_predictor(config, beam_size=2))
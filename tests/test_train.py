@@ -0,0 +1,73 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+import utils
+from conftest import make_examples
+
+
+def build_run(label_train, examples, log_path, checkpoints=None):
+    sampler = utils.ResumableSampler(examples, seed=label_train.opt.seed)
+    loader = torch.utils.data.DataLoader(examples, batch_size=label_train.config.batch_size, sampler=sampler,
+                                         collate_fn=utils.label_padding)
+    datas = {'trainloader': loader, 'sampler': sampler}
+    model, optim, _ = label_train.build_model(checkpoints, lambda s: None)
+    params = label_train.build_params(datas, lambda s: None, log_path)
+    if checkpoints is not None:
+        label_train.resume(checkpoints, datas, params)
+    return model, optim, datas, params
+
+
+def test_resumed_run_matches_uninterrupted_run(label_train, tmp_path, monkeypatch):
+    monkeypatch.setitem(label_train.config, 'save_interval', 3)
+    # 10 updates, the classifier's dropout draws from the RNG at every one
+    examples = make_examples(40)
+    log_path = str(tmp_path) + '/'
+
+    torch.manual_seed(1)
+    model, optim, datas, params = build_run(label_train, examples, log_path)
+    label_train.train(model, datas, optim, params)
+    params['saver'].close()
+
+    checkpoints = torch.load(log_path + 'checkpoint_6.pt', weights_only=False)
+    assert checkpoints['updates'] == 6 and len(checkpoints['rng']) == 1
+    # the resumed run must not depend on the RNG state it starts with
+    torch.manual_seed(2)
+    resumed, optim, datas, params = build_run(label_train, examples, log_path, checkpoints)
+    label_train.train(resumed, datas, optim, params)
+    params['saver'].close()
+
+    assert params['updates'] == 10
+    for name, tensor in model.state_dict().items():
+        assert torch.equal(tensor, resumed.state_dict()[name]), name
+
+
+
+def test_split_pieces_add_up_to_full_batch(label_train):
+    torch.manual_seed(1)
+    model = label_train.create_model(None)
+    # no dropout, so that the pieces and the full batch see the same network
+    model.eval()
+    loader = torch.utils.data.DataLoader(make_examples(8), batch_size=8, collate_fn=utils.label_padding)
+    batch = next(label_train.load_updates(loader, 1))[0]
+    src, tgt = batch[0], batch[1]
+    norm = (tgt[:, 1:].ne(utils.PAD).sum(), src.size(0))
+
+    def loss_and_grads(pieces):
+        model.zero_grad()
+        total = 0
+        for src, tgt, label, lengths, tgt_len in pieces:
+            loss, _ = model(src, lengths, tgt[:, :-1], tgt[:, 1:], label, norm=norm)
+            loss.backward()
+            total += float(loss)
+        return total, [p.grad.clone() for p in model.parameters()]
+
+    loss, grads = loss_and_grads([batch])
+    pieces = label_train.split_batch(batch)
+    # the pieces are padded less than the full batch
+    assert pieces[1][0].size(1) < src.size(1)
+    split_loss, split_grads = loss_and_grads(pieces)
+
+    assert split_loss == pytest.approx(loss, rel=1e-5)
+    for grad, split_grad in zip(grads, split_grads):
+        assert torch.allclose(grad, split_grad, atol=1e-6)
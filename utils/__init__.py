@@ -1,10 +1,33 @@
-'''
- @Date  : 2017/12/18
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
-'''
-from .data_helper import *
-from .dict_helper import *
-from .misc_utils import *
-from .metrics import *
+'''
+ @Date  : 2017/12/18
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
+'''
+import importlib
+import os
+
+from .data_helper import *
+from .dict_helper import *
+from .misc_utils import *
+
+# these load torch.distributed, numpy, sqlite3 or pyrouge, so each is only
+# imported once one of its names is used
+lazy_modules = ['checkpoint_helper', 'dist_helper', 'cache_helper', 'metrics']
+lazy_names = {name: module for module in lazy_modules
+              for name in defined_names(os.path.join(os.path.dirname(__file__), module + '.py'))}
+
+
+def __getattr__(name):
+    if name not in lazy_names:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    module = lazy_names[name]
+    submodule = importlib.import_module('.' + module, __name__)
+    for n, m in lazy_names.items():
+        if m == module:
+            globals()[n] = getattr(submodule, n)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_names))
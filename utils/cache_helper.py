@@ -0,0 +1,73 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class ResultCache(object):
+    """
+    LRU cache of JSON-serializable results, bounded by the size of their
+    encodings. With `path`, every result is also written to an SQLite file
+    that outlives the process and is consulted on memory misses.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, path=None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits, self.disk_hits, self.misses = 0, 0, 0
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB)')
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(value.decode('utf8'))
+            if self.db is not None:
+                row = self.db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self.insert(key, bytes(row[0]))
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return json.loads(bytes(row[0]).decode('utf8'))
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        value = json.dumps(result, ensure_ascii=False).encode('utf8')
+        with self.lock:
+            self.insert(key, value)
+            if self.db is not None:
+                self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?)', (key, value))
+                self.db.commit()
+
+    def insert(self, key, value):
+        if key in self.entries:
+            self.bytes -= len(key) + len(self.entries.pop(key))
+        if len(key) + len(value) > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.bytes += len(key) + len(value)
+        while self.bytes > self.max_bytes:
+            old_key, old_value = self.entries.popitem(last=False)
+            self.bytes -= len(old_key) + len(old_value)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+                    'entries': len(self.entries), 'bytes': self.bytes}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
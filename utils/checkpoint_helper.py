@@ -0,0 +1,119 @@
+import glob
+import os
+import queue
+import random
+import threading
+import numpy as np
+import torch
+
+
+def clone_state(obj):
+    """Copy every tensor nested in dicts / lists / tuples to detached CPU memory."""
+    if torch.is_tensor(obj):
+        obj = obj.detach()
+        return obj.cpu() if obj.is_cuda else obj.clone()
+    if isinstance(obj, dict):
+        return type(obj)((k, clone_state(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(clone_state(v) for v in obj)
+    return obj
+
+
+def atomic_save(obj, path):
+    """torch.save through a synced tmp file, so that `path` is either the old or the new file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def get_rng_state():
+    np_state = np.random.get_state()
+    state = {'python': random.getstate(),
+             # plain lists, so that the checkpoint needs no numpy to unpickle
+             'numpy': [np_state[0], np_state[1].tolist()] + list(np_state[2:]),
+             'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np_state = state['numpy']
+    np.random.set_state((np_state[0], np.array(np_state[1], dtype=np.uint32)) + tuple(np_state[2:]))
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+class CheckpointSaver(object):
+    """
+    Serializes checkpoints on a background thread.
+
+    `save` copies the state on the calling thread and returns; the writer
+    thread dumps it to `path + '.tmp'` and renames it over `path`, so a crash
+    never leaves a half written checkpoint behind. Rotating checkpoints are
+    deleted once more than `keep` of them exist, counting the files matching
+    `pattern` that an earlier run left. A failed write is raised by the next
+    `save`, `wait` or `close`.
+    """
+
+    def __init__(self, keep=5, pattern=None):
+        self.keep = keep
+        # oldest first
+        self.history = sorted(glob.glob(pattern), key=os.path.getmtime) if pattern else []
+        self.error = None
+        # at most one pending copy, so a slow disk throttles the trainer instead of filling memory
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def save(self, path, checkpoints, rotate=False):
+        self.check()
+        self.queue.put((path, clone_state(checkpoints), rotate))
+
+    def check(self):
+        if self.error is not None:
+            path, e = self.error
+            self.error = None
+            raise RuntimeError('failed to write checkpoint %s' % path) from e
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            path, checkpoints, rotate = item
+            try:
+                self._write(path, checkpoints)
+                if rotate:
+                    self._rotate(path)
+            except Exception as e:
+                self.error = (path, e)
+            finally:
+                self.queue.task_done()
+
+    def _write(self, path, checkpoints):
+        atomic_save(checkpoints, path)
+
+    def _rotate(self, path):
+        if path in self.history:
+            self.history.remove(path)
+        self.history.append(path)
+        while len(self.history) > self.keep:
+            old_path = self.history.pop(0)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+
+    def wait(self):
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.check()
@@ -1,234 +1,338 @@
-'''
- @Date  : 2017/12/18
- @Author: Shuming Ma
- @mail  : shumingma@pku.edu.cn 
- @homepage: shumingma.com
-'''
-import linecache
-import torch
-import torch.utils.data as torch_data
-from random import Random
-import utils
-
-num_samples = 1
-
-
-class MonoDataset(torch_data.Dataset):
-
-    def __init__(self, infos, indexes=None):
-
-        self.srcF = infos['srcF']
-        self.original_srcF = infos['original_srcF']
-        self.length = infos['length']
-        self.infos = infos
-        if indexes is None:
-            self.indexes = list(range(self.length))
-        else:
-            self.indexes = indexes
-
-    def __getitem__(self, index):
-        index = self.indexes[index]
-        src = list(map(int, linecache.getline(self.srcF, index+1).strip().split()))
-        original_src = linecache.getline(self.original_srcF, index+1).strip().split()
-
-        return src, original_src
-
-    def __len__(self):
-        return len(self.indexes)
-
-
-class BiDataset(torch_data.Dataset):
-
-    def __init__(self, infos, indexes=None, char=False):
-
-        self.srcF = infos['srcF']
-        self.tgtF = infos['tgtF']
-        self.original_srcF = infos['original_srcF']
-        self.original_tgtF = infos['original_tgtF']
-        self.length = infos['length']
-        self.infos = infos
-        self.char = char
-        if indexes is None:
-            self.indexes = list(range(self.length))
-        else:
-            self.indexes = indexes
-
-    def __getitem__(self, index):
-        index = self.indexes[index]
-        src = list(map(int, linecache.getline(self.srcF, index+1).strip().split()))
-        tgt = list(map(int, linecache.getline(self.tgtF, index+1).strip().split()))
-        original_src = linecache.getline(self.original_srcF, index+1).strip().split()
-        original_tgt = linecache.getline(self.original_tgtF, index+1).strip().split() if not self.char else \
-                       list(linecache.getline(self.original_tgtF, index + 1).strip())
-
-        return src, tgt, original_src, original_tgt
-
-    def __len__(self):
-        return len(self.indexes)
-
-
-class LabelDataset(torch_data.Dataset):
-
-    def __init__(self, infos, indexes=None, char=False):
-
-        self.srcF = infos['srcF']
-        self.tgtF = infos['tgtF']
-        self.labF = infos['labF']
-        self.original_srcF = infos['original_srcF']
-        self.original_tgtF = infos['original_tgtF']
-        self.length = infos['length']
-        self.infos = infos
-        self.char = char
-        if indexes is None:
-            self.indexes = list(range(self.length))
-        else:
-            self.indexes = indexes
-
-    def __getitem__(self, index):
-        index = self.indexes[index]
-        src = list(map(int, linecache.getline(self.srcF, index+1).strip().split()))
-        tgt = list(map(int, linecache.getline(self.tgtF, index+1).strip().split()))
-        label = int(linecache.getline(self.labF, index+1).strip())-1
-        original_src = linecache.getline(self.original_srcF, index+1).strip().split()
-        original_tgt = linecache.getline(self.original_tgtF, index+1).strip().split() if not self.char else \
-                       list(linecache.getline(self.original_tgtF, index + 1).strip())
-
-        return src, tgt, label, original_src, original_tgt
-
-    def __len__(self):
-        return len(self.indexes)
-
-
-def splitDataset(data_set, sizes):
-    length = len(data_set)
-    indexes = list(range(length))
-    rng = Random()
-    rng.seed(1234)
-    rng.shuffle(indexes)
-
-    data_sets = []
-    part_len = int(length / sizes)
-    for i in range(sizes-1):
-        data_sets.append(BiDataset(data_set.infos, indexes[0:part_len]))
-        indexes = indexes[part_len:]
-    data_sets.append(BiDataset(data_set.infos, indexes))
-    return data_sets
-
-
-def padding(data):
-    src, tgt, original_src, original_tgt = zip(*data)
-
-    src_len = [len(s) for s in src]
-    src_pad = torch.zeros(len(src), max(src_len)).long()
-    for i, s in enumerate(src):
-        end = src_len[i]
-        src_pad[i, :end] = torch.LongTensor(s)
-
-    tgt_len = [len(s) for s in tgt]
-    tgt_pad = torch.zeros(len(tgt), max(tgt_len)).long()
-    for i, s in enumerate(tgt):
-        end = tgt_len[i]
-        tgt_pad[i, :end] = torch.LongTensor(s)[:end]
-
-    return src_pad, tgt_pad, \
-           torch.LongTensor(src_len), torch.LongTensor(tgt_len), \
-           original_src, original_tgt
-
-
-def soft_padding(data):
-    src, tgt, original_src, original_tgt = zip(*data)
-
-    src_len = [len(s) for s in src]
-    src_pad = torch.zeros(len(src), max(src_len)).long()
-    for i, s in enumerate(src):
-        end = src_len[i]
-        src_pad[i, :end] = torch.LongTensor(s)
-
-    tgt_len = [len(s) for s in tgt]
-    tgt_pad = torch.zeros(len(tgt), max(tgt_len)).long()
-    for i, s in enumerate(tgt):
-        end = tgt_len[i]
-        tgt_pad[i, :end] = torch.LongTensor(s)[:end]
-
-    return src_pad, tgt_pad, \
-           torch.LongTensor(src_len), torch.LongTensor(tgt_len), \
-           original_src, original_tgt
-
-
-def label_padding(data):
-    src, tgt, label, original_src, original_tgt = zip(*data)
-
-    src_len = [len(s) for s in src]
-    src_pad = torch.zeros(len(src), max(src_len)).long()
-    for i, s in enumerate(src):
-        end = src_len[i]
-        src_pad[i, :end] = torch.LongTensor(s)
-
-    tgt_len = [len(s) for s in tgt]
-    tgt_pad = torch.zeros(len(tgt), max(tgt_len)).long()
-    for i, s in enumerate(tgt):
-        end = tgt_len[i]
-        tgt_pad[i, :end] = torch.LongTensor(s)[:end]
-
-    return src_pad, tgt_pad, torch.LongTensor(label), \
-           torch.LongTensor(src_len), torch.LongTensor(tgt_len), \
-           original_src, original_tgt
-
-
-def ae_padding(data):
-    src, tgt, original_src, original_tgt = zip(*data)
-
-    src_len = [len(s) for s in src]
-    src_pad = torch.zeros(len(src), max(src_len)).long()
-    for i, s in enumerate(src):
-        end = src_len[i]
-        src_pad[i, :end] = torch.LongTensor(s)[:end]
-
-    tgt_len = [len(s) for s in tgt]
-    tgt_pad = torch.zeros(len(tgt), max(tgt_len)).long()
-    for i, s in enumerate(tgt):
-        end = tgt_len[i]
-        tgt_pad[i, :end] = torch.LongTensor(s)[:end]
-
-    ae_len = [len(s)+2 for s in src]
-    ae_pad = torch.zeros(len(src), max(ae_len)).long()
-    for i, s in enumerate(src):
-        end = ae_len[i]
-        ae_pad[i, 0] = utils.BOS
-        ae_pad[i, 1:end-1] = torch.LongTensor(s)[:end-2]
-        ae_pad[i, end-1] = utils.EOS
-
-    return src_pad, tgt_pad, ae_pad, \
-           torch.LongTensor(src_len), torch.LongTensor(tgt_len), torch.LongTensor(ae_len), \
-           original_src, original_tgt
-
-
-def split_padding(data):
-    src, tgt, original_src, original_tgt = zip(*data)
-
-    split_samples = []
-    num_per_sample = int(len(src) / utils.num_samples)
-
-    for i in range(utils.num_samples):
-        split_src = src[i*num_per_sample:(i+1)*num_per_sample]
-        split_tgt = tgt[i*num_per_sample:(i+1)*num_per_sample]
-        split_original_src = original_src[i * num_per_sample:(i + 1) * num_per_sample]
-        split_original_tgt = original_tgt[i * num_per_sample:(i + 1) * num_per_sample]
-
-        src_len = [len(s) for s in split_src]
-        src_pad = torch.zeros(len(split_src), max(src_len)).long()
-        for i, s in enumerate(split_src):
-            end = src_len[i]
-            src_pad[i, :end] = torch.LongTensor(s)[:end]
-
-        tgt_len = [len(s) for s in split_tgt]
-        tgt_pad = torch.zeros(len(split_tgt), max(tgt_len)).long()
-        for i, s in enumerate(split_tgt):
-            end = tgt_len[i]
-            tgt_pad[i, :end] = torch.LongTensor(s)[:end]
-
-        split_samples.append([src_pad, tgt_pad,
-                              torch.LongTensor(src_len), torch.LongTensor(tgt_len),
-                              split_original_src, split_original_tgt])
-
+'''
+ @Date  : 2017/12/18
+ @Author: Shuming Ma
+ @mail  : shumingma@pku.edu.cn 
+ @homepage: shumingma.com
+'''
+import linecache
+import os
+import torch
+import torch.utils.data as torch_data
+from random import Random
+import utils
+
+num_samples = 1
+
+
+class MonoDataset(torch_data.Dataset):
+
+    def __init__(self, infos, indexes=None):
+
+        self.srcF = infos['srcF']
+        self.original_srcF = infos['original_srcF']
+        self.length = infos['length']
+        self.infos = infos
+        if indexes is None:
+            self.indexes = list(range(self.length))
+        else:
+            self.indexes = indexes
+
+    def __getitem__(self, index):
+        index = self.indexes[index]
+        src = list(map(int, linecache.getline(self.srcF, index+1).strip().split()))
+        original_src = linecache.getline(self.original_srcF, index+1).strip().split()
+
+        return src, original_src
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+class BiDataset(torch_data.Dataset):
+
+    def __init__(self, infos, indexes=None, char=False):
+
+        self.srcF = infos['srcF']
+        self.tgtF = infos['tgtF']
+        self.original_srcF = infos['original_srcF']
+        self.original_tgtF = infos['original_tgtF']
+        self.length = infos['length']
+        self.infos = infos
+        self.char = char
+        if indexes is None:
+            self.indexes = list(range(self.length))
+        else:
+            self.indexes = indexes
+
+    def __getitem__(self, index):
+        index = self.indexes[index]
+        src = list(map(int, linecache.getline(self.srcF, index+1).strip().split()))
+        tgt = list(map(int, linecache.getline(self.tgtF, index+1).strip().split()))
+        original_src = linecache.getline(self.original_srcF, index+1).strip().split()
+        original_tgt = linecache.getline(self.original_tgtF, index+1).strip().split() if not self.char else \
+                       list(linecache.getline(self.original_tgtF, index + 1).strip())
+
+        return src, tgt, original_src, original_tgt
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+class LabelDataset(torch_data.Dataset):
+
+    def __init__(self, infos, indexes=None, char=False):
+
+        self.srcF = infos['srcF']
+        self.tgtF = infos['tgtF']
+        self.labF = infos['labF']
+        self.original_srcF = infos['original_srcF']
+        self.original_tgtF = infos['original_tgtF']
+        self.length = infos['length']
+        self.infos = infos
+        self.char = char
+        if indexes is None:
+            self.indexes = list(range(self.length))
+        else:
+            self.indexes = indexes
+
+    def stamp(self):
+        """Sizes and modification times of the files read, which change when they are rewritten."""
+        files = [self.srcF, self.tgtF, self.labF, self.original_srcF, self.original_tgtF]
+        return tuple((os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files)
+
+    def __getitem__(self, index):
+        index = self.indexes[index]
+        src = list(map(int, linecache.getline(self.srcF, index+1).strip().split()))
+        tgt = list(map(int, linecache.getline(self.tgtF, index+1).strip().split()))
+        label = int(linecache.getline(self.labF, index+1).strip())-1
+        original_src = linecache.getline(self.original_srcF, index+1).strip().split()
+        original_tgt = linecache.getline(self.original_tgtF, index+1).strip().split() if not self.char else \
+                       list(linecache.getline(self.original_tgtF, index + 1).strip())
+
+        return src, tgt, label, original_src, original_tgt
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+class ResumableSampler(torch_data.Sampler):
+    """
+    Random sampler whose permutation and position can be checkpointed.
+
+    Every epoch draws its permutation from `seed + epoch`. With
+    `num_replicas` > 1 each rank iterates over its own strided shard of the
+    permutation, padded so that all ranks see the same number of examples.
+    The position counts the indices handed out so far, which equals the
+    consumed examples as long as the loader does not prefetch (num_workers=0).
+    """
+
+    def __init__(self, data_source, seed=1234, num_replicas=1, rank=0):
+        self.data_source = data_source
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.perm = None
+        self.position = 0
+
+    def set_epoch(self, epoch):
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self.perm = None
+            self.position = 0
+
+    def shard(self, perm):
+        total_size = len(self) * self.num_replicas
+        perm = torch.cat([perm, perm[:total_size - len(perm)]])
+        return perm[self.rank:total_size:self.num_replicas]
+
+    def __iter__(self):
+        if self.perm is None:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            self.perm = torch.randperm(len(self.data_source), generator=generator)
+            self.position = 0
+        indices = self.shard(self.perm)
+        while self.position < len(indices):
+            self.position += 1
+            yield int(indices[self.position - 1])
+
+    def __len__(self):
+        return (len(self.data_source) + self.num_replicas - 1) // self.num_replicas
+
+    def state_dict(self):
+        return {'epoch': self.epoch, 'perm': self.perm, 'position': self.position}
+
+    def load_state_dict(self, state_dict):
+        self.epoch = state_dict['epoch']
+        self.perm = state_dict['perm']
+        self.position = state_dict['position']
+
+
+def splitDataset(data_set, sizes):
+    length = len(data_set)
+    indexes = list(range(length))
+    rng = Random()
+    rng.seed(1234)
+    rng.shuffle(indexes)
+
+    data_sets = []
+    part_len = int(length / sizes)
+    for i in range(sizes-1):
+        data_sets.append(BiDataset(data_set.infos, indexes[0:part_len]))
+        indexes = indexes[part_len:]
+    data_sets.append(BiDataset(data_set.infos, indexes))
+    return data_sets
+
+
+def padding(data):
+    src, tgt, original_src, original_tgt = zip(*data)
+
+    src_len = [len(s) for s in src]
+    src_pad = torch.zeros(len(src), max(src_len)).long()
+    for i, s in enumerate(src):
+        end = src_len[i]
+        src_pad[i, :end] = torch.LongTensor(s)
+
+    tgt_len = [len(s) for s in tgt]
+    tgt_pad = torch.zeros(len(tgt), max(tgt_len)).long()
+    for i, s in enumerate(tgt):
+        end = tgt_len[i]
+        tgt_pad[i, :end] = torch.LongTensor(s)[:end]
+
+    return src_pad, tgt_pad, \
+           torch.LongTensor(src_len), torch.LongTensor(tgt_len), \
+           original_src, original_tgt
+
+
+def soft_padding(data):
+    src, tgt, original_src, original_tgt = zip(*data)
+
+    src_len = [len(s) for s in src]
+    src_pad = torch.zeros(len(src), max(src_len)).long()
+    for i, s in enumerate(src):
+        end = src_len[i]
+        src_pad[i, :end] = torch.LongTensor(s)
+
+    tgt_len = [len(s) for s in tgt]
+    tgt_pad = torch.zeros(len(tgt), max(tgt_len)).long()
+    for i, s in enumerate(tgt):
+        end = tgt_len[i]
+        tgt_pad[i, :end] = torch.LongTensor(s)[:end]
+
+    return src_pad, tgt_pad, \
+           torch.LongTensor(src_len), torch.LongTensor(tgt_len), \
+           original_src, original_tgt
+
+
+def label_padding(data):
+    src, tgt, label, original_src, original_tgt = zip(*data)
+
+    src_len = [len(s) for s in src]
+    src_pad = torch.zeros(len(src), max(src_len)).long()
+    for i, s in enumerate(src):
+        end = src_len[i]
+        src_pad[i, :end] = torch.LongTensor(s)
+
+    tgt_len = [len(s) for s in tgt]
+    tgt_pad = torch.zeros(len(tgt), max(tgt_len)).long()
+    for i, s in enumerate(tgt):
+        end = tgt_len[i]
+        tgt_pad[i, :end] = torch.LongTensor(s)[:end]
+
+    return src_pad, tgt_pad, torch.LongTensor(label), \
+           torch.LongTensor(src_len), torch.LongTensor(tgt_len), \
+           original_src, original_tgt
+
+
+def label_sorted_padding(data):
+    src_pad, tgt_pad, label, src_len, tgt_len, original_src, original_tgt = label_padding(data)
+
+    # sort by source length once here so that `sample` can skip it;
+    # original_src / original_tgt keep the dataset order
+    src_len, indices = torch.sort(src_len, dim=0, descending=True)
+    _, reverse_indices = torch.sort(indices)
+    src_pad = torch.index_select(src_pad, dim=0, index=indices)
+    tgt_pad = torch.index_select(tgt_pad, dim=0, index=indices)
+    label = torch.index_select(label, dim=0, index=indices)
+    tgt_len = torch.index_select(tgt_len, dim=0, index=indices)
+
+    return src_pad, tgt_pad, label, src_len, tgt_len, reverse_indices, \
+           original_src, original_tgt
+
+
+class BatchCache(object):
+    """
+    Materializes all batches of a (non-shuffled) loader once and replays them
+    from memory. If `path` is given the batches are also stored on disk and
+    reused as long as `key` matches.
+    """
+
+    def __init__(self, loader, path=None, key=None):
+        self.batches = None
+        if path and os.path.exists(path):
+            cached = torch.load(path)
+            if cached['key'] == key:
+                self.batches = cached['batches']
+        if self.batches is None:
+            self.batches = list(loader)
+            if path:
+                # processes that build the cache at the same time do not share a tmp file
+                tmp = '%s.%d.tmp' % (path, os.getpid())
+                torch.save({'key': key, 'batches': self.batches}, tmp)
+                os.replace(tmp, path)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+
+def ae_padding(data):
+    src, tgt, original_src, original_tgt = zip(*data)
+
+    src_len = [len(s) for s in src]
+    src_pad = torch.zeros(len(src), max(src_len)).long()
+    for i, s in enumerate(src):
+        end = src_len[i]
+        src_pad[i, :end] = torch.LongTensor(s)[:end]
+
+    tgt_len = [len(s) for s in tgt]
+    tgt_pad = torch.zeros(len(tgt), max(tgt_len)).long()
+    for i, s in enumerate(tgt):
+        end = tgt_len[i]
+        tgt_pad[i, :end] = torch.LongTensor(s)[:end]
+
+    ae_len = [len(s)+2 for s in src]
+    ae_pad = torch.zeros(len(src), max(ae_len)).long()
+    for i, s in enumerate(src):
+        end = ae_len[i]
+        ae_pad[i, 0] = utils.BOS
+        ae_pad[i, 1:end-1] = torch.LongTensor(s)[:end-2]
+        ae_pad[i, end-1] = utils.EOS
+
+    return src_pad, tgt_pad, ae_pad, \
+           torch.LongTensor(src_len), torch.LongTensor(tgt_len), torch.LongTensor(ae_len), \
+           original_src, original_tgt
+
+
+def split_padding(data):
+    src, tgt, original_src, original_tgt = zip(*data)
+
+    split_samples = []
+    num_per_sample = int(len(src) / utils.num_samples)
+
+    for i in range(utils.num_samples):
+        split_src = src[i*num_per_sample:(i+1)*num_per_sample]
+        split_tgt = tgt[i*num_per_sample:(i+1)*num_per_sample]
+        split_original_src = original_src[i * num_per_sample:(i + 1) * num_per_sample]
+        split_original_tgt = original_tgt[i * num_per_sample:(i + 1) * num_per_sample]
+
+        src_len = [len(s) for s in split_src]
+        src_pad = torch.zeros(len(split_src), max(src_len)).long()
+        for i, s in enumerate(split_src):
+            end = src_len[i]
+            src_pad[i, :end] = torch.LongTensor(s)[:end]
+
+        tgt_len = [len(s) for s in split_tgt]
+        tgt_pad = torch.zeros(len(split_tgt), max(tgt_len)).long()
+        for i, s in enumerate(split_tgt):
+            end = tgt_len[i]
+            tgt_pad[i, :end] = torch.LongTensor(s)[:end]
+
+        split_samples.append([src_pad, tgt_pad,
+                              torch.LongTensor(src_len), torch.LongTensor(tgt_len),
+                              split_original_src, split_original_tgt])
+
     return split_samples
\ No newline at end of file
@@ -0,0 +1,113 @@
+import datetime
+import torch
+import torch.distributed as dist
+
+
+# rank of a worker that trains without a process group (hogwild)
+_worker = {'rank': 0, 'world_size': 1}
+
+
+def set_worker(rank, world_size):
+    _worker['rank'], _worker['world_size'] = rank, world_size
+
+
+def init_distributed(url, world_size, rank, timeout=7200):
+    # the timeout has to cover a full evaluation on rank 0 while the others wait
+    dist.init_process_group(backend='gloo', init_method=url, world_size=world_size, rank=rank,
+                            timeout=datetime.timedelta(seconds=timeout))
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else _worker['rank']
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else _worker['world_size']
+
+
+def broadcast_parameters(model, src=0):
+    for tensor in model.state_dict().values():
+        dist.broadcast(tensor, src)
+
+
+def all_reduce_sum(values):
+    """Sum a list of numbers over all processes."""
+    tensor = torch.tensor([float(v) for v in values], dtype=torch.float64)
+    dist.all_reduce(tensor)
+    return tensor.tolist()
+
+
+def all_gather_object(obj):
+    """The `obj` of every process in rank order, only [obj] without a process group."""
+    if not is_distributed():
+        return [obj]
+    objects = [None] * dist.get_world_size()
+    dist.all_gather_object(objects, obj)
+    return objects
+
+
+def all_reduce_gradients(params, sparse_params=(), bucket_size=2**22):
+    """
+    Sum the gradients of `params` over all processes, flattened into buckets
+    of about `bucket_size` elements. Missing gradients take part as zeros so
+    that every rank reduces the same tensors. The sparse gradients of
+    `sparse_params` are summed row-wise, see _all_reduce_sparse.
+    """
+    sparse_ids = set(id(p) for p in sparse_params)
+    bucket, size = [], 0
+    for param in params:
+        if id(param) in sparse_ids:
+            if param.grad is None:
+                param.grad = torch.sparse_coo_tensor(param.data.new_zeros((1, 0), dtype=torch.long),
+                                                     param.data.new_zeros((0,) + param.size()[1:]), param.size())
+            param.grad = _all_reduce_sparse(param.grad)
+            continue
+        if param.grad is None:
+            param.grad = torch.zeros_like(param.data)
+        bucket.append(param.grad.data)
+        size += param.grad.numel()
+        if size >= bucket_size:
+            _all_reduce_bucket(bucket)
+            bucket, size = [], 0
+    if len(bucket) > 0:
+        _all_reduce_bucket(bucket)
+
+
+def _all_reduce_sparse(grad):
+    """
+    Sum of a sparse row gradient over all processes. Only the rows that are
+    present travel: every rank gathers the indices and rows of the others,
+    padded to the largest count.
+    """
+    grad = grad.coalesce()
+    indices, values = grad.indices(), grad.values()
+    counts = [torch.zeros(1, dtype=torch.long) for _ in range(dist.get_world_size())]
+    dist.all_gather(counts, torch.LongTensor([indices.size(1)]))
+    counts = [int(c) for c in counts]
+    most = max(counts)
+
+    padded_indices = indices.new_zeros(indices.size(0), most)
+    padded_indices[:, :indices.size(1)] = indices
+    padded_values = values.new_zeros((most,) + values.size()[1:])
+    padded_values[:values.size(0)] = values
+    all_indices = [torch.zeros_like(padded_indices) for _ in counts]
+    all_values = [torch.zeros_like(padded_values) for _ in counts]
+    dist.all_gather(all_indices, padded_indices)
+    dist.all_gather(all_values, padded_values)
+
+    indices = torch.cat([i[:, :n] for i, n in zip(all_indices, counts)], dim=1)
+    values = torch.cat([v[:n] for v, n in zip(all_values, counts)], dim=0)
+    return torch.sparse_coo_tensor(indices, values, grad.size()).coalesce()
+
+
+def _all_reduce_bucket(bucket):
+    flat = torch.cat([grad.view(-1) for grad in bucket])
+    dist.all_reduce(flat)
+    offset = 0
+    for grad in bucket:
+        grad.copy_(flat[offset:offset + grad.numel()].view_as(grad))
+        offset += grad.numel()